@@ -0,0 +1,147 @@
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import toml
+from clientCore import (CONFIG_FILE, HISTORY_DB, METRICS, ChatCore, MessageStore, load_config, setup_logging, log,
+                        set_log_level)
+
+# Headless client for bots, relays and monitoring: incoming messages go to stdout, every stdin line is sent.
+# Imports only the core, so it starts without Qt, pygame or the markdown renderer.
+
+START = time.perf_counter()
+
+class ConsoleCore(ChatCore):
+    def __init__(self, config, store=None, history=0, out=sys.stdout):
+        super().__init__(config, store)
+        self.history = history
+        self.out = out
+        self.connected = asyncio.Event()
+
+    def write(self, line):
+        self.out.write(line + "\n")
+        self.out.flush()
+
+    def on_status(self, text, state):
+        if state != "connected":  # on_connected logs it, with the time it took
+            log(text)
+
+    def on_connected(self, server_info, online_users):
+        log(f"Connected to \"{server_info['name']}\" ({self.uri}) in {(time.perf_counter() - START) * 1000:.0f}ms")
+        if type(online_users) == list:
+            log("Online Users: " + ", ".join(online_users))
+        self.connected.set()
+
+    def on_connect_failed(self, error):
+        log(f"Connection failed: {error}", logging.ERROR)
+
+    def on_history(self, messages, replace):
+        for message_username, content, timestamp in messages[-self.history:] if self.history else []:
+            self.write(f"[{timestamp}] <{message_username}> {content}")
+
+    def on_message(self, data, timestamp, prepared=None):
+        if data["type"] == "msg" and not data["event"] == "request":
+            self.write(f"[{data.get('timestamp', timestamp)}] <{data['username']}> {data['message']}")
+
+    def on_server_message(self, data, timestamp):
+        self.write(f"[{timestamp}] <{data['username']}> {data['message']}")
+
+    def on_server_command(self, command, timestamp):
+        log(f"Server command: {command}")
+
+    def on_disconnected(self, reason):
+        self.connected.clear()
+        log(f"Disconnected ({reason})")
+
+    def on_send_status(self, entry, state):
+        if state == "failed":
+            log(f"Failed to send: {entry['message']}", logging.ERROR)
+
+    def on_notice(self, text):
+        log(text)
+
+async def read_stdin(core):
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            return
+        line = line.rstrip("\n")
+        if line.strip():
+            core.queue_message(line)
+
+async def send_and_exit(core, messages):
+    for message in messages:
+        core.queue_message(message)
+    await core.connected.wait()
+    while core.outbox:
+        await asyncio.sleep(0.05)
+    await core.close()
+
+async def export_metrics(path, interval):
+    # Prometheus textfile (or JSON for a .json path) for bots watched by node_exporter
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, METRICS.export, path)
+        except OSError as e:
+            log(f"Could not export metrics to {path}: {e}", logging.WARNING)
+        await asyncio.sleep(interval)
+
+async def main(args, config):
+    store = None if args.no_store else MessageStore(HISTORY_DB)
+    core = ConsoleCore(config, store, args.history)
+    METRICS.gauge("outbox", lambda: len(core.outbox))
+    METRICS.gauge("receive_queue", lambda: core.frames.qsize() if core.frames else 0)
+    if store:
+        METRICS.gauge("store_queue", store.queue.qsize)
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("export_file"):
+        asyncio.get_running_loop().create_task(export_metrics(metrics_config["export_file"],
+                                                              metrics_config.get("export_interval", 15)))
+    supervisor = core.start()
+    if args.send:
+        await send_and_exit(core, args.send)
+    else:
+        asyncio.get_running_loop().create_task(read_stdin(core))
+    try:
+        await supervisor
+    finally:
+        if store:
+            store.close()
+        if metrics_config.get("export_file"):
+            METRICS.export(metrics_config["export_file"])  # final numbers for one-shot runs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless GIchat client")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--username")
+    parser.add_argument("--history", type=int, default=0, metavar="N", help="print the last N history messages on connect")
+    parser.add_argument("--send", action="append", metavar="MESSAGE", help="send MESSAGE and exit once it is delivered (repeatable)")
+    parser.add_argument("--no-store", action="store_true", help="don't record messages in the local history database")
+    parser.add_argument("--log-file", help="also log to this file")
+    parser.add_argument("--metrics-file", help="export metrics to this file periodically (.json for JSON, else Prometheus text)")
+    args = parser.parse_args()
+
+    setup_logging(args.log_file, sys.stderr)
+    try:
+        config = load_config(args.config)
+    except toml.TomlDecodeError as e:
+        log(f"Invalid config TOML: {e}", logging.ERROR)
+        sys.exit(1)
+    set_log_level(config["client"].get("log_level", "INFO"))
+    if args.host:
+        config["server"]["host"] = args.host
+    if args.port:
+        config["server"]["port"] = args.port
+    if args.username:
+        config["client"]["username"] = args.username
+    if args.metrics_file:
+        config.setdefault("metrics", {})["export_file"] = args.metrics_file
+    try:
+        asyncio.run(main(args, config))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,1017 @@
+import sys
+import asyncio
+import threading
+import os
+import json
+import time
+import random
+import queue
+import sqlite3
+import atexit
+import logging
+import logging.handlers
+import statistics
+import itertools
+import bisect
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import websockets
+import toml
+from websockets.protocol import State
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Connection, history and send/receive logic shared by every front end. Nothing in here may import Qt,
+# pygame or anything else a headless client doesn't need, and importing it has no side effects.
+
+# === Config and Logging ===
+CLI_VERSION = "2.1.2"
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOG_FILE = os.path.join(CLI_DIR, "latest.log")
+CONFIG_FILE = os.path.join(CLI_DIR, "config.toml")
+CACHE_DIR = os.path.join(CLI_DIR, "cache")
+HISTORY_DB = os.path.join(CLI_DIR, "history.db")
+
+LOGGER = logging.getLogger("gichat")
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # StreamHandler flushes after every record; LogListener flushes once per batch instead. The size is
+    # counted here rather than asked of the stream, whose tell() would flush it for every record
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self.bytes_written = os.path.getsize(self.baseFilename)
+
+    def doRollover(self):
+        super().doRollover()
+        self.bytes_written = 0
+
+    def emit(self, record):
+        try:
+            message = self.format(record) + self.terminator
+            size = len(message.encode(self.encoding or "utf-8", "replace"))
+            if self.maxBytes > 0 and self.bytes_written + size >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(message)
+            self.bytes_written += size
+        except Exception:
+            self.handleError(record)
+
+class LogListener(logging.handlers.QueueListener):
+    # writes whatever queued up since the last batch, and flushes when the queue runs dry
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+def setup_logging(log_file=LOG_FILE, stream=sys.stdout):
+    handlers = []
+    if log_file:
+        file_handler = BufferedRotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        if os.path.getsize(log_file):
+            file_handler.doRollover()  # keep the previous session as latest.log.1 instead of truncating it
+        handlers.append(file_handler)
+    if stream:
+        handlers.append(logging.StreamHandler(stream))
+    log_queue = queue.SimpleQueue()
+    LOGGER.addHandler(logging.handlers.QueueHandler(log_queue))
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+    listener = LogListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def log(msg, level=logging.INFO):
+    LOGGER.log(level, msg)
+
+def set_log_level(level):
+    LOGGER.setLevel(level.upper() if isinstance(level, str) else level)
+
+def default_config():
+    return {
+        "client": {
+            "username": f"NewUser_{random.randint(1, 1000000)}",
+            "font": {"name": "Helvetica", "size": 10},
+            "admin_key": "",
+            "soundpack": "gichat",
+            "log_level": "INFO"
+        },
+        "server": {
+            "host": "grigga-industries.ydns.eu",
+            "port": 8765
+        },
+        "tabs": {
+            "servers": []
+        },
+        "images": {
+            "workers": 8,
+            "timeout": 10,
+            "cache_size_mb": 256,
+            "cache_ttl_days": 7,
+            "prefetch_screens": 3,
+            "decoded_cache_mb": 64,
+            "index_save_interval": 30
+        },
+        "console": {
+            "flush_interval_ms": 16,
+            "max_batch": 500,
+            "scrollback_blocks": 5000,
+            "scrollback_chars": 2000000,
+            "background_backlog": 5000
+        },
+        "sounds": {
+            "channels": 8,
+            "burst_window_ms": 250
+        },
+        "uploads": {
+            "max_dimension": 2048,
+            "timeout": 60
+        },
+        "http": {
+            "connections": 16,
+            "connections_per_host": 4,
+            "connect_timeout": 5,
+            "read_timeout": 15,
+            "max_image_mb": 20
+        },
+        "latency": {
+            "interval": 5,
+            "timeout": 10
+        },
+        "protocol": {
+            "compression": "deflate",
+            "history_chunk": 500,
+            "max_frame_mb": 64
+        },
+        "outbox": {
+            "max_size": 100,
+            "write_buffer_limit": 65536
+        },
+        "startup": {
+            "cached_messages": 200
+        },
+        "receive": {
+            "workers": 2,
+            "queue_size": 10000
+        },
+        "metrics": {
+            "export_file": "",
+            "export_interval": 15
+        },
+        "reconnect": {
+            "base_delay": 1,
+            "max_delay": 60,
+            "connect_timeout": 10,
+            "keepalive_interval": 20,
+            "keepalive_timeout": 20
+        }
+    }
+
+def save_config(data, path=CONFIG_FILE):
+    with open(path, "w") as f:
+        toml.dump(data, f)
+
+def load_config(path=CONFIG_FILE):
+    # toml.TomlDecodeError is left to the caller, which knows how to show it
+    try:
+        data = toml.load(path)
+        log("Config Loaded")
+        return data
+    except FileNotFoundError:
+        log("Config file missing, using defaults")
+        data = default_config()
+        save_config(data, path)
+        return data
+
+def timestamp_now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+# === Wire Format ===
+# offered as WebSocket subprotocols; a server that picks none (or an older server) gets plain JSON text frames
+WIRE_MSGPACK = "gichat.msgpack"
+WIRE_JSON = "gichat.json"
+WIRE_FORMATS = [WIRE_MSGPACK, WIRE_JSON] if msgpack else [WIRE_JSON]
+
+def encode_frame(data, wire_format=WIRE_JSON):
+    if wire_format == WIRE_MSGPACK:
+        return msgpack.packb(data)
+    if orjson:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data)
+
+def decode_frame(message):
+    if isinstance(message, bytes) and msgpack:
+        return msgpack.unpackb(message)
+    if orjson:
+        return orjson.loads(message)  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return json.loads(message)
+
+def expand_history(messages):
+    # compact history lists each username once: {"users": [...], "rows": [[user_index, content, timestamp], ...]}
+    if isinstance(messages, dict):
+        users = messages["users"]
+        return [[users[user], content, timestamp] for user, content, timestamp in messages["rows"]]
+    return messages
+
+# === HTTP ===
+class HttpClient:
+    # one pooled session for all image and upload traffic, used from the chat loop; aiohttp loads on the first request
+    def __init__(self, connections=16, connections_per_host=4, connect_timeout=5, read_timeout=15, max_size=20 * 1024 * 1024):
+        self.connections = connections
+        self.connections_per_host = connections_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_size = max_size
+        self.session = None
+        self.stats = {"requests": 0, "not_modified": 0, "bytes": 0, "connections": 0, "reused": 0}
+
+    def _session(self):
+        if self.session is None:
+            import aiohttp
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._count("connections"))
+            trace.on_connection_reuseconn.append(self._count("reused"))
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections_per_host),
+                timeout=self._timeout(None), trace_configs=[trace])
+        return self.session
+
+    def _count(self, key):
+        async def count(session, context, params):
+            self.stats[key] += 1
+        return count
+
+    def _timeout(self, total):
+        import aiohttp
+        return aiohttp.ClientTimeout(total=total, connect=self.connect_timeout, sock_read=self.read_timeout)
+
+    async def get(self, url, timeout=None, max_size=None, etag=None, modified=None):
+        # returns (body, (etag, last_modified)); body is None when the validators say our copy is still current
+        max_size = max_size or self.max_size
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        self.stats["requests"] += 1
+        async with self._session().get(url, headers=headers, timeout=self._timeout(timeout)) as response:
+            if response.status == 304:
+                self.stats["not_modified"] += 1
+                return None, (etag, modified)
+            response.raise_for_status()
+            if response.content_length is not None and response.content_length > max_size:
+                raise ValueError(f"{url} is {response.content_length} bytes, over the {max_size} byte limit")
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                body += chunk
+                if len(body) > max_size:
+                    raise ValueError(f"{url} is over the {max_size} byte limit")
+            self.stats["bytes"] += len(body)
+            return bytes(body), (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    async def post(self, url, data, headers=None, timeout=None):
+        self.stats["requests"] += 1
+        async with self._session().post(url, data=data, headers=headers, timeout=self._timeout(timeout)) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+# === Message Store ===
+class MessageStore:
+    # local copy of every message seen, with a full-text index; writes are batched on a background thread
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            server TEXT NOT NULL,
+            username TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            local INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (server, timestamp, username, content)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, username, content='messages', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content, username) VALUES (new.id, new.content, new.username);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, username)
+            VALUES ('delete', old.id, old.content, old.username);
+        END;
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+        if "local" not in [column[1] for column in self.db.execute("PRAGMA table_info(messages)")]:
+            self.db.execute("ALTER TABLE messages ADD COLUMN local INTEGER NOT NULL DEFAULT 0")  # stores made before the column
+        self.db.execute("CREATE INDEX IF NOT EXISTS messages_local ON messages (server, username, content) WHERE local = 1")
+        self.db.commit()
+        self.writer = threading.Thread(target=self._write_loop, name="message-store", daemon=True)
+        self.writer.start()
+
+    def add(self, server, username, content, timestamp, local=False):
+        # local: timestamp is our clock, not the server's (what we sent, live messages it didn't date)
+        self.queue.put([(server, username, content, timestamp, int(local))])
+
+    def add_many(self, server, messages):
+        self.queue.put([(server, username, content, timestamp, 0) for username, content, timestamp in messages])
+
+    def _write_loop(self):
+        db = sqlite3.connect(self.path)
+        running = True
+        while running:
+            rows = self.queue.get()
+            if rows is None:
+                break
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    more = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if more is None:
+                    running = False
+                    break
+                rows.extend(more)
+            try:
+                with db:
+                    self._insert(db, rows)
+            except sqlite3.Error as e:
+                log(f"Message store write error: {e}", logging.ERROR)
+        db.close()
+
+    @staticmethod
+    def _insert(db, rows):
+        # a local row makes way for the server's copy once that turns up (usually in the next history), so the
+        # same message isn't stored twice under two clocks. Matched on everything but the timestamp, within a
+        # day for clock and timezone differences
+        insert = "INSERT OR IGNORE INTO messages (server, username, content, timestamp, local) VALUES (?, ?, ?, ?, ?)"
+        servers = {row[0] for row in rows}
+        if not any(row[4] for row in rows) and not any(
+                db.execute("SELECT 1 FROM messages WHERE local = 1 AND server = ? LIMIT 1", (server,)).fetchone() for server in servers):
+            db.executemany(insert, rows)
+            return
+        for row in rows:
+            if db.execute(insert, row).rowcount and not row[4]:
+                db.execute("DELETE FROM messages WHERE id = (SELECT id FROM messages WHERE local = 1 AND server = ? AND username = ? "
+                           "AND content = ? AND abs(julianday(timestamp) - julianday(?)) <= 1 ORDER BY id LIMIT 1)", row[:4])
+
+    def recent(self, server, limit=200):
+        # by timestamp first: streamed history stores its older chunks after the newer ones
+        return self.db.execute(
+            "SELECT username, content, timestamp FROM messages WHERE server = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (server, limit)).fetchall()[::-1]
+
+    def search(self, query, limit=200):
+        # quote every term so user input can't break the FTS syntax; trailing * gives prefix matches
+        terms = " ".join('"' + term.replace('"', '""') + '"*' for term in query.split())
+        if not terms:
+            return []
+        return self.db.execute(
+            "SELECT m.server, m.username, m.content, m.timestamp FROM messages_fts "
+            "JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? ORDER BY m.timestamp DESC LIMIT ?",
+            (terms, limit)).fetchall()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.db.close()
+
+# === Outbox ===
+class Outbox:
+    # messages waiting to be sent, in order; bounded so a long outage can't queue without limit
+    def __init__(self, max_size=100):
+        self.entries = deque()
+        self.max_size = max_size
+        self.ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, message):
+        if len(self.entries) >= self.max_size:
+            return None
+        entry = {"id": next(self.ids), "message": message}
+        self.entries.append(entry)
+        return entry
+
+# === Latency ===
+class LatencyMonitor:
+    # round trips of WebSocket ping/pong frames on the chat connection, in seconds
+    def __init__(self, window=50):
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+
+    def add(self, rtt):
+        self.samples.append(rtt)
+
+    def reset(self):
+        self.samples.clear()
+        self.failures = 0
+
+    def stats(self):
+        if not self.samples:
+            return None
+        samples = list(self.samples)
+        ordered = sorted(samples)
+        return {
+            "last": samples[-1] * 1000,
+            "min": ordered[0] * 1000,
+            "avg": statistics.fmean(samples) * 1000,
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            "jitter": statistics.fmean(abs(b - a) for a, b in zip(samples, samples[1:])) * 1000 if len(samples) > 1 else 0.0,
+            "samples": len(samples),
+            "failures": self.failures
+        }
+
+    def summary(self):
+        stats = self.stats()
+        if stats is None:
+            return "RTT: -"
+        return f"RTT {stats['last']:.0f}ms (min {stats['min']:.0f} / avg {stats['avg']:.0f} / p95 {stats['p95']:.0f} / jitter {stats['jitter']:.0f})"
+
+# === Metrics ===
+# bucket upper bounds in seconds; everything we time lands somewhere between a cached lookup and a slow download
+METRIC_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=1000)  # percentiles over the latest samples, not the whole session
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def snapshot(self):
+        ordered = sorted(self.recent)
+        def percentile(point):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * point))] if ordered else None
+        return {"count": self.count, "sum": self.sum, "buckets": list(self.counts),
+                "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                "max": ordered[-1] if ordered else None}
+
+class StageTimer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+class Metrics:
+    # stage timings, counters and gauges for the Debug window and the exporters; cheap enough to stay on.
+    # gauges are callables read at snapshot time, so whoever snapshots must be on the thread that owns them
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def time(self, stage):
+        return StageTimer(self, stage)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        with self.lock:
+            stages = {stage: histogram.snapshot() for stage, histogram in self.stages.items()}
+            counters = dict(self.counters)
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                log(f"Could not read gauge {name}: {e}", logging.DEBUG)
+        return {"version": CLI_VERSION, "time": time.time(), "uptime": time.time() - self.started,
+                "buckets": list(METRIC_BUCKETS), "stages": stages, "counters": counters, "gauges": gauges}
+
+    def to_json(self, snapshot=None):
+        return json.dumps(snapshot or self.snapshot(), indent=2)
+
+    def to_prometheus(self, snapshot=None):
+        # text exposition format, for node_exporter's textfile collector
+        snapshot = snapshot or self.snapshot()
+        lines = ["# HELP gichat_stage_seconds Time spent in each client pipeline stage.",
+                 "# TYPE gichat_stage_seconds histogram"]
+        for stage, histogram in sorted(snapshot["stages"].items()):
+            cumulative = 0
+            for bound, count in zip([*snapshot["buckets"], "+Inf"], histogram["buckets"]):
+                cumulative += count
+                lines.append(f'gichat_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'gichat_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'gichat_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE gichat_{name}_total counter", f"gichat_{name}_total {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines += [f"# TYPE gichat_{name} gauge", f"gichat_{name} {value}"]
+        lines += ["# TYPE gichat_uptime_seconds gauge", f"gichat_uptime_seconds {snapshot['uptime']:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, snapshot=None):
+        # .json gets the JSON dump, anything else the Prometheus text; replaced atomically so a collector
+        # never reads half a file
+        text = self.to_json(snapshot) if path.endswith(".json") else self.to_prometheus(snapshot)
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+METRICS = Metrics()
+
+# === Chat Core ===
+class ChatCore:
+    # One server connection. Front ends subclass this and override the on_* hooks; hooks run on the
+    # asyncio loop, so a GUI has to hand anything it wants to draw over to its own thread. prepare() is
+    # the exception: it runs on a receive worker, for the work that shouldn't hold up the loop.
+    def __init__(self, config, store=None, executor=None):
+        self.config = config
+        self.username = config["client"]["username"]
+        self.host = config["server"]["host"]
+        self.port = config["server"]["port"]
+        self.uri = f"ws://{self.host}:{self.port}"
+        self.store = store
+        self.loop = None
+        self.websocket = None
+        self.wire_format = WIRE_JSON
+        self.pending_events = []
+        self.history_seen = {"uri": None, "count": 0, "last": None}
+        self.history_stream = None
+        self.latency = LatencyMonitor()
+        self.latency_task = None
+        self.supervisor = None
+        self.outbox = Outbox(config.get("outbox", {}).get("max_size", 100))
+        self.outbox_lock = asyncio.Lock()
+        self.auto_reconnect = True
+        self.shutdown_flag = False
+        self.reconnect_now = asyncio.Event()
+        self.status = None  # the last state passed to on_status
+        self.frames = None
+        self.executor = executor or ThreadPoolExecutor(config.get("receive", {}).get("workers", 2),
+                                                       thread_name_prefix="receive")
+
+    def set_status(self, text, state):
+        self.status = state
+        self.on_status(text, state)
+
+    # --- hooks ---
+    def on_status(self, text, state):
+        # state is one of "connecting", "connected", "offline"
+        pass
+
+    def on_connected(self, server_info, online_users):
+        pass
+
+    def on_connect_failed(self, error):
+        pass
+
+    def on_history(self, messages, replace):
+        pass
+
+    def on_history_older(self, messages):
+        # a chunk of a full reload streamed after on_history(..., True): older than everything passed to the
+        # hooks since then, oldest message first
+        pass
+
+    def on_message(self, data, timestamp, prepared=None):
+        # prepared is what prepare() returned for this frame, None for events held during the handshake
+        pass
+
+    def on_server_message(self, data, timestamp):
+        pass
+
+    def on_server_command(self, command, timestamp):
+        pass
+
+    def on_disconnected(self, reason):
+        pass
+
+    def on_send_status(self, entry, state):
+        # state is "sent" or "failed"
+        pass
+
+    def on_latency(self):
+        # also called once the connection goes away, with latency_task cleared
+        pass
+
+    def on_notice(self, text):
+        pass
+
+    # --- connection ---
+    def start(self):
+        # call from the loop's own thread, before or while it runs
+        self.loop = asyncio.get_event_loop()
+        self.supervisor = self.loop.create_task(self.supervise())
+        return self.supervisor
+
+    async def supervise(self):
+        # keeps the connection up until the user disconnects; backoff uses full jitter so a server restart
+        # doesn't get every client back at the same instant
+        self.loop = asyncio.get_running_loop()
+        reconnect_config = self.config.get("reconnect", {})
+        base_delay = reconnect_config.get("base_delay", 1)
+        max_delay = reconnect_config.get("max_delay", 60)
+        attempt = 0
+        self.auto_reconnect = True
+        # checked again after every backoff, since the user may have disconnected while we waited
+        while self.auto_reconnect and not self.shutdown_flag:
+            self.reconnect_now.clear()
+            self.set_status(f"Connecting to {self.uri}..." if attempt == 0 else
+                           f"Reconnecting to {self.uri} (attempt {attempt})...", "connecting")
+            if await self.connect():
+                attempt = 0
+            if not self.auto_reconnect or self.shutdown_flag:
+                break
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            attempt += 1
+            self.set_status(f"Connection lost, reconnecting in {delay:.1f}s (attempt {attempt})", "connecting")
+            log(f"Reconnecting in {delay:.1f}s (attempt {attempt})")
+            try:
+                await asyncio.wait_for(self.reconnect_now.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        if self.status != "offline":  # disconnect() has usually said so already
+            self.set_status("Offline", "offline")
+
+    async def connect(self):
+        uri = self.uri
+        reconnect_config = self.config.get("reconnect", {})
+        try:
+            self.websocket = await websockets.connect(uri, open_timeout=reconnect_config.get("connect_timeout", 10),
+                                                      ping_interval=reconnect_config.get("keepalive_interval", 20),
+                                                      ping_timeout=reconnect_config.get("keepalive_timeout", 20),
+                                                      compression=self.config.get("protocol", {}).get("compression", "deflate") or None,
+                                                      max_size=int(self.config.get("protocol", {}).get("max_frame_mb", 64) * 1024 * 1024),
+                                                      subprotocols=WIRE_FORMATS)
+            websocket = self.websocket
+            self.wire_format = self.websocket.subprotocol or WIRE_JSON
+            log(f"Negotiated wire format {self.wire_format}")
+            await self.websocket.send(self.username)
+            self.pending_events = []
+            server_info = await self.recv_reply()
+            data = {
+                "username": self.username,
+                "message": "RAW:USERLIST",
+                "event": "request",
+                "type": "msg"
+            }
+            await self.send_data(data)
+            log(f"Requesting user list from server...")
+            online_users = await self.recv_reply()
+            log(f"Retrieved user list")
+            await self.retrieve_messages(uri, server_info)
+            self.on_connected(server_info, online_users)
+            self.set_status(f"Connected to \"{server_info['name']}\" ({uri})", "connected")
+            self.latency_task = self.loop.create_task(self.monitor_latency())
+            if self.outbox:
+                log(f"Flushing {len(self.outbox)} queued messages")
+                self.loop.create_task(self.flush_outbox())
+        except Exception as e:
+            log(f"Connection failed: {e}", logging.WARNING)
+            log(traceback.format_exc(), logging.DEBUG)
+            self.on_connect_failed(e)
+            if self.websocket:
+                await self.websocket.close()
+                self.websocket = None
+            return False
+        for data in self.pending_events:
+            await self.handle_event(data)
+        self.pending_events = []
+        await self.receive_messages()
+        if self.history_stream:
+            # the older chunks never made it; fetch the whole history again instead of a delta on top of the gap
+            log("Connection closed while history was still streaming", logging.WARNING)
+            self.history_stream = None
+            self.history_seen["count"] = 0
+        if self.websocket is websocket:
+            # dropped by the server or the keepalive rather than by disconnect()
+            await self.disconnect(reason="lost")
+        return True
+
+    async def disconnect(self, reason: str):
+        if reason in ("client", "kick"):
+            self.auto_reconnect = False
+            self.reconnect_now.set()  # wakes a supervisor sitting in its backoff, which then stops
+        if self.latency_task:
+            self.latency_task.cancel()
+            self.latency_task = None
+            self.on_latency()
+        websocket = self.websocket
+        if websocket:
+            self.websocket = None  # detached first so connect() doesn't also report the close as a lost connection
+            try:
+                await websocket.close(reason="Client Disconnect")
+            except Exception as e:
+                log(f"WebSocket close error: {e}", logging.WARNING)
+            self.on_disconnected(reason)
+            self.set_status("Offline", "offline")
+
+    async def reconnect(self):
+        self.on_notice("Reconnecting...")
+        self.auto_reconnect = True
+        await self.disconnect(reason="reconnect")
+        self.reconnect_now.set()
+        if self.supervisor is None or self.supervisor.done():
+            self.supervisor = self.loop.create_task(self.supervise())
+
+    async def close(self):
+        self.shutdown_flag = True
+        await self.disconnect(reason="client")
+
+    def is_connected(self):
+        return self.websocket is not None and self.websocket.state is State.OPEN
+
+    async def send_data(self, data):
+        await self.websocket.send(encode_frame(data, self.wire_format))
+
+    async def recv_reply(self):
+        # the server pushes events (joins, chat) whenever they happen, including between a request and
+        # its reply; hold them until the handshake is done
+        while True:
+            message = await self.websocket.recv()
+            METRICS.count("ws_frames")
+            METRICS.count("ws_bytes", len(message))
+            with METRICS.time("decode"):
+                data = decode_frame(message)
+            if not (isinstance(data, dict) and "event" in data):
+                return data
+            if data["event"] != "send_message":
+                self.pending_events.append(data)  # chat sent before the history reply is already part of it
+
+    # --- history ---
+    async def retrieve_messages(self, uri, server_info):
+        data = {
+            "username": self.username,
+            "message": "RAW:MSGDB",
+            "event": "request",
+            "type": "msg"
+        }
+        capabilities = server_info.get("capabilities", [])
+        seen = self.history_seen if self.history_seen["uri"] == uri and self.history_seen["count"] else None
+        delta = seen is not None and "msgdb_since" in capabilities
+        if delta:
+            data["since"] = seen["count"]
+        if "compact_history" in capabilities:
+            data["compact"] = True
+        # newest chunk first; it finishes the handshake and the older ones follow through receive_messages.
+        # Full reloads only: a delta's older chunks would still be newer than what we show, and checking our
+        # copy against a server without deltas means seeing all of it
+        chunked = "chunked_history" in capabilities and seen is None
+        if chunked:
+            data["chunk"] = self.config.get("protocol", {}).get("history_chunk", 500)
+        start = time.perf_counter()
+        await self.send_data(data)
+        if delta:
+            log(f"Requesting message DB from server since message {seen['count']}...")
+        else:
+            log("Requesting message DB from server...")
+
+        reply = await self.recv_reply()
+        METRICS.observe("history", time.perf_counter() - start)  # request to decoded (first) reply
+        if chunked:
+            self.first_history_chunk(uri, reply["history"], start)
+            return
+        messages = expand_history(reply)
+        log(f"Retrieved {len(messages)} messages from server")
+
+        replace = False
+        if delta:
+            new_messages = messages
+        elif seen and len(messages) >= seen["count"] and messages[seen["count"] - 1][:2] == seen["last"]:
+            # server has no delta support, but what we already show is still a prefix of its history
+            new_messages = messages[seen["count"]:]
+        else:
+            new_messages = messages
+            replace = True
+            self.history_seen = {"uri": uri, "count": 0, "last": None}
+        for message_username, content, _ in new_messages:
+            self.note_message(message_username, content)
+        log(f"{len(new_messages)} new messages to render")
+
+        if self.store and new_messages:
+            self.store.add_many(uri, new_messages)
+        if replace or new_messages:
+            self.on_history(new_messages, replace)
+
+    def first_history_chunk(self, uri, chunk, start):
+        messages = expand_history(chunk["messages"])
+        self.history_seen = {"uri": uri, "count": chunk["total"], "last": list(messages[-1][:2]) if messages else None}
+        if chunk["start"] > 0:
+            self.history_stream = {"received": len(messages), "start": start}
+            log(f"Retrieved the newest {len(messages)} of {chunk['total']} messages, older ones follow")
+        else:
+            log(f"Retrieved {len(messages)} messages from server")
+
+        if self.store and messages:
+            self.store.add_many(uri, messages)
+        self.on_history(messages, True)
+
+    def receive_history(self, chunk):
+        stream = self.history_stream
+        if stream is None:
+            return  # left over from a connection that was reset meanwhile
+        messages = expand_history(chunk["messages"])
+        if self.store and messages:
+            self.store.add_many(self.history_seen["uri"], messages)
+        self.on_history_older(messages)
+        stream["received"] += len(messages)
+        if chunk["start"] == 0:
+            elapsed = time.perf_counter() - stream["start"]
+            METRICS.observe("history_stream", elapsed)
+            log(f"Retrieved all {stream['received']} messages in {elapsed * 1000:.0f}ms")
+            self.history_stream = None
+
+    def note_message(self, message_username, content):
+        self.history_seen["count"] += 1
+        self.history_seen["last"] = [message_username, content]
+
+    async def monitor_latency(self):
+        latency_config = self.config.get("latency", {})
+        interval = latency_config.get("interval", 5)
+        timeout = latency_config.get("timeout", 10)
+        self.latency.reset()
+        while self.websocket:
+            start = time.perf_counter()
+            try:
+                pong_waiter = await self.websocket.ping()
+                await asyncio.wait_for(pong_waiter, timeout)
+                self.latency.add(time.perf_counter() - start)
+            except asyncio.TimeoutError:
+                self.latency.failures += 1
+                log(f"Ping timed out after {timeout}s", logging.WARNING)
+            except websockets.exceptions.ConnectionClosed:
+                break
+            self.on_latency()
+            await asyncio.sleep(interval)
+
+    # --- sending ---
+    def queue_message(self, msg):
+        # safe from any thread; returns the outbox entry, or None when the outbox is full
+        entry = self.outbox.add(msg)
+        if entry is None:
+            log(f"Outbox full ({self.outbox.max_size} messages), dropping message", logging.WARNING)
+        elif self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.flush_outbox(), self.loop)
+        return entry
+
+    async def flush_outbox(self):
+        if self.outbox_lock.locked():
+            return
+        async with self.outbox_lock:
+            buffer_limit = self.config.get("outbox", {}).get("write_buffer_limit", 64 * 1024)
+            while self.outbox.entries and self.is_connected():
+                # backpressure: let the socket drain before queueing more behind a slow link
+                transport = self.websocket.transport
+                if transport is not None and transport.get_write_buffer_size() > buffer_limit:
+                    await asyncio.sleep(0.01)
+                    continue
+                entry = self.outbox.entries[0]
+                try:
+                    await self._send_message(entry["message"])
+                except websockets.exceptions.ConnectionClosed:
+                    break  # stays pending until the supervisor reconnects
+                except Exception as e:
+                    self.outbox.entries.popleft()
+                    log(f"Failed to send message: {e}", logging.ERROR)
+                    self.on_send_status(entry, "failed")
+                    continue
+                self.outbox.entries.popleft()
+                self.on_send_status(entry, "sent")
+
+    async def _send_message(self, msg):
+        data = {
+            "type": "msg",
+            "username": self.username,
+            "message": msg,
+            "event": "send_message",
+            "admin_key": self.config["client"].get("admin_key", " ")
+        }
+
+        with METRICS.time("send"):
+            await self.send_data(data)
+        self.note_message(self.username, msg)
+        if self.store:
+            self.store.add(self.history_seen["uri"], self.username, msg, timestamp_now(), local=True)
+
+    # --- receiving ---
+    # reader -> bounded queue -> decode/prepare on the receive workers -> hooks, in arrival order. The reader
+    # only drains the socket and hands frames to the workers, so slow rendering never backs up the server.
+    def prepare(self, data):
+        return None
+
+    def prepare_frame(self, message):
+        with METRICS.time("decode"):
+            data = decode_frame(message)
+        with METRICS.time("prepare"):
+            return data, self.prepare(data)
+
+    async def receive_messages(self):
+        websocket = self.websocket
+        self.frames = frames = asyncio.Queue(self.config.get("receive", {}).get("queue_size", 10000))
+        delivery = self.loop.create_task(self.deliver_frames(frames))
+        # without a prepare() there's only a decode of a few microseconds, cheaper than the hop to a worker
+        offload = type(self).prepare is not ChatCore.prepare
+        closed = stalled = False
+        try:
+            async for message in websocket:
+                METRICS.count("ws_frames")
+                METRICS.count("ws_bytes", len(message))
+                if frames.full() and not stalled:
+                    # only a bound on memory; it takes a wedged hook, not slow rendering, to get here
+                    METRICS.count("receive_stalls")
+                    log(f"Receive queue full ({frames.maxsize} frames), reading paused", logging.WARNING)
+                stalled = frames.full()
+                if offload:
+                    message = self.loop.run_in_executor(self.executor, self.prepare_frame, message)
+                await frames.put((message, time.perf_counter()))
+        except websockets.exceptions.ConnectionClosed:
+            closed = True
+        except asyncio.CancelledError:
+            delivery.cancel()
+            raise
+        await frames.put(None)
+        await delivery  # whatever arrived before the close is still shown
+        if closed:
+            self.on_notice("Connection closed.")
+
+    async def deliver_frames(self, frames):
+        while (item := await frames.get()) is not None:
+            frame, received = item
+            try:
+                data, prepared = await frame if isinstance(frame, asyncio.Future) else self.prepare_frame(frame)
+                with METRICS.time("dispatch"):
+                    await self.handle_event(data, prepared)
+            except json.JSONDecodeError:
+                self.on_notice("Received invalid JSON")
+            except Exception as e:
+                log(f"Error occurred when receiving a message: {e}", logging.ERROR)
+            METRICS.observe("receive", time.perf_counter() - received)  # socket to hooks, queueing included
+
+    async def handle_event(self, data, prepared=None):
+        timestamp = timestamp_now()
+        if "history" in data and "event" not in data:
+            self.receive_history(data["history"])
+        elif data["event"] == "srv_message":
+            self.on_server_message(data, timestamp)
+            if "have been kicked" in data['message']:
+                await self.disconnect("kick")
+        elif data["event"] == "srv_command":
+            if data['message'] == "CLEAR_MESSAGE_DB":
+                self.history_seen["count"] = 0
+                self.history_seen["last"] = None
+            self.on_server_command(data['message'], timestamp)
+        else:
+            if data["type"] == "msg" and not data["event"] == "request":
+                self.note_message(data['username'], data['message'])
+                if self.store:
+                    self.store.add(self.history_seen["uri"], data['username'], data['message'],
+                                   data.get('timestamp', timestamp), local="timestamp" not in data)
+            self.on_message(data, timestamp, prepared)
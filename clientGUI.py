@@ -1,94 +1,427 @@
+import time
+STARTED = time.perf_counter()  # time-to-first-paint is measured from here
 import sys
 import asyncio
 import threading
 import os
 import json
-import time
-import random
+import re
+import copy
+import shutil
+import tempfile
+import functools
 import base64
-import traceback
-import markdown
-import requests
 import uuid
-import websockets
+import hashlib
+import io
+import html
+import logging
 import toml
 import webbrowser
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QPushButton, QTextEdit, QLabel,
                              QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QLineEdit, QDialog,
-                             QProgressBar, QMenuBar, QAction, QGridLayout, QLayout)
-from PyQt5.QtGui import QIcon, QPixmap, QTextCursor, QFont, QTextDocument
+                             QProgressBar, QMenuBar, QAction, QGridLayout, QLayout, QTabWidget, QTabBar, QInputDialog)
+from PyQt5.QtGui import QIcon, QPixmap, QImage, QTextCursor, QFont, QTextDocument, QTextImageFormat, QColor
 from PyQt5.QtCore import Qt, pyqtSignal, QObject, QTimer, QCoreApplication, QEventLoop, QMetaObject, QUrl
-from PIL import Image
-from ping3 import ping
-from pygame import mixer
-
-mixer.init()
+import clientCore
+from clientCore import (CLI_VERSION, CLI_DIR, CACHE_DIR, HISTORY_DB, METRICS, METRIC_BUCKETS, ChatCore, MessageStore,
+                        HttpClient, setup_logging, log, set_log_level, save_config, timestamp_now)
 
 # === Config and Logging ===
-CLI_VERSION = "2.1.2"
-CLI_DIR = os.path.dirname(__file__)
 os.chdir(CLI_DIR)
 
-LOG_FILE = os.path.join(CLI_DIR, "latest.log")
-CONFIG_FILE = os.path.join(CLI_DIR, "config.toml")
-
-with open(LOG_FILE, "w") as f:
-    f.write("")
-
-def log(msg):
-    print(msg)
-    with open(LOG_FILE, "a") as f:
-        f.write(msg + "\n")
-
-def save_config(data):
-    with open(CONFIG_FILE, "w") as f:
-        toml.dump(data, f)
+LOG_LISTENER = None  # started in __main__, so importing this module (benchmarks, tools) leaves latest.log alone
 
 def load_config():
     try:
-        data = toml.load(CONFIG_FILE)
-        log("Config Loaded")
-        return data
+        return clientCore.load_config()
     except toml.TomlDecodeError:
         log("Invalid Config TOML")
         QMessageBox.critical(None, "TOML Decode Error",
                              "Config file contains invalid TOML. Fix the issues or delete it to generate a new one.")
         sys.exit()
-    except FileNotFoundError:
-        log("Config file missing, using defaults")
-        data = {
-            "client": {
-                "username": f"NewUser_{random.randint(1, 1000000)}",
-                "font": {"name": "Helvetica", "size": 10},
-                "admin_key": "",
-                "soundpack": "gichat"
-            },
-            "server": {
-                "host": "grigga-industries.ydns.eu",
-                "port": 8765
-            }
-        }
-        save_config(data)
-        return data
+
+# === Sounds ===
+class SoundCache:
+    # decoded sounds kept in memory, played on a fixed channel pool; repeats within the burst window are folded
+    def __init__(self, channels=8, burst_window=0.25):
+        self.sounds = {}
+        self.last_played = {}
+        self.channels = channels
+        self.burst_window = burst_window
+        self.lock = threading.Lock()
+        self.mixer = None
+        self.disabled = False  # no usable audio device: the client runs without sound
+
+    def _load_mixer(self):
+        # pygame costs more to import and initialise than the rest of the client, so it waits for the first sound
+        if self.mixer is None and not self.disabled:
+            import pygame
+            from pygame import mixer
+            try:
+                mixer.init()
+            except pygame.error as e:
+                log(f"Sound disabled: {e}", logging.WARNING)
+                self.disabled = True
+                return None
+            mixer.set_num_channels(self.channels)
+            self.mixer = mixer
+        return self.mixer
+
+    def _load(self, path):
+        if path not in self.sounds:
+            if not os.path.exists(path):
+                log(f"sound `{path}` not found!", logging.WARNING)
+                self.sounds[path] = None
+                return None
+            mixer = self._load_mixer()
+            if mixer is None:
+                return None
+            import pygame
+            try:
+                self.sounds[path] = mixer.Sound(path)
+            except pygame.error as e:
+                log(f"Could not load sound `{path}`: {e}", logging.WARNING)
+                self.sounds[path] = None
+        return self.sounds[path]
+
+    def preload(self, pack):
+        pack_dir = os.path.join("assets", "sounds", pack)
+        with self.lock:
+            for name in os.listdir(pack_dir) if os.path.isdir(pack_dir) else []:
+                if name.endswith(".wav"):
+                    self._load(os.path.join(pack_dir, name))
+            self._load(os.path.join("assets", "sounds", "error.wav"))
+
+    def play(self, path):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_played.get(path, 0) < self.burst_window:
+                return True
+            self.last_played[path] = now
+            sound = self._load(path)
+        if sound is None:
+            return self.disabled  # a missing sound plays the error sound instead, unless there's no sound at all
+        with METRICS.time("sound"):
+            channel = self.mixer.find_channel(True)  # steals the longest-playing channel when all are busy
+            if channel is not None:
+                channel.play(sound)
+        return True
+
+SOUND_CACHE = SoundCache()
 
 # === Utility ===
 def playsound(path):
-    mixer.Sound(path).play()
+    return SOUND_CACHE.play(path)
 
 def playerror():
-    errorSoundPath = os.path.join("assets", "sounds", "error.wav")
-    if os.path.exists(errorSoundPath):
-        playsound(errorSoundPath)
+    playsound(os.path.join("assets", "sounds", "error.wav"))
 
 def playeventsound(event):
     path = os.path.join("assets", "sounds", CLI_CONFIG["client"]["soundpack"], f"{event}.wav")
-    if os.path.exists(path):
-        playsound(path)
-    else:
-        log(f"sound `{path}` not found!")
+    if not playsound(path):
         playerror()
 
+async def read_image(http, cache, executor, url, timeout, max_size):
+    # i/o stage on the chat loop: a fresh or revalidated cached thumbnail, otherwise the downloaded original
+    # (digest None) and the validators to store with it
+    loop = asyncio.get_running_loop()
+    cached = await loop.run_in_executor(executor, cache.get, url)
+    if cached is not None:
+        return (*cached, None)
+    etag, modified = cache.validators(url)
+    with METRICS.time("image_fetch"):
+        data, validators = await http.get(url, timeout, max_size, etag, modified)
+    if data is None:
+        cached = await loop.run_in_executor(executor, cache.refresh, url)
+        if cached is not None:
+            return (*cached, None)
+        data, validators = await http.get(url, timeout, max_size)  # the thumbnail went missing meanwhile
+    return None, data, validators
+
+def decode_image(cache, url, digest, image_data, width=300, validators=None):
+    # cpu stage on the decode pool; QImage, unlike QPixmap, is safe to build off the GUI thread
+    with METRICS.time("image_decode"):
+        return _decode_image(cache, url, digest, image_data, width, validators)
+
+def _decode_image(cache, url, digest, image_data, width, validators):
+    if digest is not None:
+        return digest, QImage.fromData(image_data)
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_data))
+    image.draft(None, (width, 1))  # JPEGs decode at the smallest DCT scale that still covers the thumbnail width
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    height = max(1, round(image.height * width / image.width))
+    image = image.resize((width, height), Image.LANCZOS).convert("RGBA")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    digest, _ = cache.put(url, image_data, out.getvalue(), *(validators or ()), size=(width, height))
+    return digest, QImage(image.tobytes("raw", "RGBA"), width, height, width * 4, QImage.Format_RGBA8888).copy()
+
+# === Uploads ===
+class MultipartBody:
+    # multipart/form-data body read in chunks, so it streams with a Content-Length and we see progress
+    def __init__(self, field, filename, fileobj, size, progress=None):
+        self.boundary = uuid.uuid4().hex
+        head = (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode("utf-8")
+        tail = f'\r\n--{self.boundary}--\r\n'.encode("utf-8")
+        self.parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self.size = len(head) + size + len(tail)
+        self.sent = 0
+        self.percent = -1
+        self.progress = progress
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size
+        chunk = b""
+        while self.parts and len(chunk) < size:
+            data = self.parts[0].read(size - len(chunk))
+            if not data:
+                self.parts.pop(0)
+            chunk += data
+        self.sent += len(chunk)
+        if self.progress and self.sent * 100 // self.size != self.percent:
+            self.percent = self.sent * 100 // self.size
+            self.progress(self.sent, self.size)
+        return chunk
+
+def prepare_upload(file_path, max_dimension):
+    # large still images are downscaled in memory, everything else streams from disk unchanged
+    filename = os.path.basename(file_path)
+    if max_dimension:
+        from PIL import Image, ImageOps
+        try:
+            with Image.open(file_path) as image:
+                if max(image.size) > max_dimension and not getattr(image, "is_animated", False):
+                    image_format = "JPEG" if image.format == "JPEG" else "PNG"
+                    image = ImageOps.exif_transpose(image)  # the re-encode drops EXIF, orientation tag included
+                    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+                    out = io.BytesIO()
+                    if image_format == "JPEG":
+                        image.save(out, format="JPEG", quality=85)
+                    else:
+                        image.save(out, format="PNG", optimize=True)
+                        filename = os.path.splitext(filename)[0] + ".png"
+                    log(f"Downscaled {filename} to {image.width}x{image.height} for upload")
+                    data = out.getvalue()
+                    return filename, io.BytesIO(data), len(data)
+        except OSError as e:
+            log(f"Could not inspect {file_path} before upload: {e}", logging.WARNING)
+    return filename, open(file_path, "rb"), os.path.getsize(file_path)
+
+def hash_upload(file_path, max_dimension):
+    filename, fileobj, size = prepare_upload(file_path, max_dimension)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return filename, fileobj, size, digest.hexdigest()
+
+async def upload_image(http, cache, executor, upload_url, file_path, max_dimension, timeout, progress=None):
+    # runs on the chat loop; downscaling, hashing and file reads go to the executor
+    loop = asyncio.get_running_loop()
+    filename, fileobj, size, digest = await loop.run_in_executor(executor, hash_upload, file_path, max_dimension)
+    with fileobj:
+        url = cache.uploaded_url(upload_url, digest)
+        if url:
+            log(f"{filename} was already uploaded as {url}, skipping upload")
+            return url
+        body = MultipartBody("file", filename, fileobj, size, progress)
+
+        async def stream():
+            while chunk := await loop.run_in_executor(executor, body.read, 64 * 1024):
+                yield chunk
+
+        result = await http.post(upload_url, stream(), timeout=timeout,
+                                 headers={"Content-Type": f"multipart/form-data; boundary={body.boundary}",
+                                          "Content-Length": str(len(body))})
+    url = f"{upload_url.rsplit('/', 1)[0]}/uploads/{result['filename']}"
+    await loop.run_in_executor(executor, cache.note_upload, upload_url, digest, url)
+    return url
+
+# === Image Cache ===
+class ImageCache:
+    # url -> content hash (revalidated after ttl), content hash -> original + thumbnail on disk (LRU by last use).
+    # Changes only mark the index dirty; save() writes it, from a timer and when the window closes. Blobs
+    # and evictions after the last save are reconciled at the next start, or the index would stop matching the disk
+    def __init__(self, path, max_bytes, ttl):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_file = os.path.join(path, "index.json")
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self.index_file, "r") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {"urls": {}, "blobs": {}}
+        self.index.setdefault("uploads", {})
+        self.total = sum(blob["size"] for blob in self.index["blobs"].values())
+        self.blob_urls = {}
+        for url, entry in self.index["urls"].items():
+            self.blob_urls.setdefault(entry["hash"], set()).add(url)
+        self._reconcile()
+
+    def _reconcile(self):
+        # files the index doesn't know would never be counted or evicted; entries without their files are gone
+        present = set()
+        for entry in os.scandir(self.path):
+            digest, _, kind = entry.name.partition(".")
+            if kind in ("orig", "thumb") and digest in self.index["blobs"]:
+                present.add(entry.name)
+                continue
+            if kind in ("orig", "thumb") or kind.endswith(".tmp"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        for digest in list(self.index["blobs"]):
+            if f"{digest}.orig" not in present or f"{digest}.thumb" not in present:
+                self._drop_blob(digest)
+
+    def _blob_path(self, digest, kind):
+        return os.path.join(self.path, f"{digest}.{kind}")
+
+    def get(self, url):
+        with self.lock:
+            entry = self.index["urls"].get(url)
+            if entry is None:
+                return None
+            blob = self.index["blobs"].get(entry["hash"])
+            if blob is None or time.time() - entry["fetched"] > self.ttl:
+                return None  # stale entries stay for their validators
+            return self._read_thumb(entry["hash"], blob)
+
+    def _read_thumb(self, digest, blob):
+        try:
+            with open(self._blob_path(digest, "thumb"), "rb") as f:
+                thumb = f.read()
+        except OSError:
+            self._drop_blob(digest)
+            return None
+        blob["used"] = time.time()
+        self.dirty = True
+        return digest, thumb
+
+    def validators(self, url):
+        with self.lock:
+            entry = self.index["urls"].get(url)
+            if entry is None or entry["hash"] not in self.index["blobs"]:
+                return None, None
+            return entry.get("etag"), entry.get("modified")
+
+    def refresh(self, url):
+        # the server answered 304: the cached copy is current for another ttl
+        with self.lock:
+            entry = self.index["urls"].get(url)
+            blob = self.index["blobs"].get(entry["hash"]) if entry else None
+            if blob is None:
+                return None
+            entry["fetched"] = time.time()
+            self.dirty = True
+            return self._read_thumb(entry["hash"], blob)
+
+    def dimensions(self, url):
+        # thumbnail size, so a placeholder can take up the same space before the image is loaded
+        with self.lock:
+            entry = self.index["urls"].get(url)
+            return tuple(entry["size"]) if entry and entry.get("size") else None
+
+    def uploaded_url(self, upload_url, digest):
+        with self.lock:
+            return self.index["uploads"].get(f"{upload_url} {digest}")
+
+    def note_upload(self, upload_url, digest, url):
+        with self.lock:
+            self.index["uploads"][f"{upload_url} {digest}"] = url
+            self.dirty = True
+
+    def thumb(self, digest):
+        # not used by the client, which gets thumbnails from get(); the render bench reads them back with it
+        with self.lock:
+            try:
+                with open(self._blob_path(digest, "thumb"), "rb") as f:
+                    return f.read()
+            except OSError:
+                return None
+
+    def _write_blob(self, digest, kind, data):
+        # written aside and moved into place, so a reader never sees half a file
+        path = self._blob_path(digest, kind)
+        tmp_file = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+
+    def put(self, url, image_data, thumb, etag=None, modified=None, size=None):
+        digest = hashlib.sha256(image_data).hexdigest()
+        with self.lock:
+            known = digest in self.index["blobs"]
+        if not known:
+            # outside the lock: an original can be 20MB, and lookups from the GUI thread shouldn't wait on it
+            self._write_blob(digest, "orig", image_data)
+            self._write_blob(digest, "thumb", thumb)
+        with self.lock:
+            if digest not in self.index["blobs"]:
+                self.index["blobs"][digest] = {"size": len(image_data) + len(thumb), "used": time.time()}
+                self.total += len(image_data) + len(thumb)
+            else:
+                self.index["blobs"][digest]["used"] = time.time()
+            previous = self.index["urls"].get(url)
+            if previous is not None:
+                self.blob_urls.get(previous["hash"], set()).discard(url)
+            self.index["urls"][url] = {"hash": digest, "fetched": time.time(), "etag": etag, "modified": modified,
+                                       "size": size}
+            self.blob_urls.setdefault(digest, set()).add(url)
+            self.dirty = True
+            if self.total > self.max_bytes:
+                self._evict()
+        return digest, thumb
+
+    def _drop_blob(self, digest):
+        blob = self.index["blobs"].pop(digest, None)
+        if blob is not None:
+            self.total -= blob["size"]
+        for url in self.blob_urls.pop(digest, ()):
+            self.index["urls"].pop(url, None)
+        self.dirty = True
+        for kind in ("orig", "thumb"):
+            try:
+                os.remove(self._blob_path(digest, kind))
+            except OSError:
+                pass
+
+    def _evict(self):
+        # least recently used first; only sorted when a put takes the cache over its budget
+        for digest, _ in sorted(self.index["blobs"].items(), key=lambda item: item[1]["used"]):
+            if self.total <= self.max_bytes:
+                break
+            self._drop_blob(digest)
+
+    def save(self):
+        # serialised under the lock, written outside it, so lookups don't wait on the disk
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = json.dumps(self.index)
+                self.dirty = False
+            tmp_file = self.index_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                f.write(data)
+            os.replace(tmp_file, self.index_file)
+
 def b64encode(path):
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
@@ -96,16 +429,151 @@ def b64encode(path):
 def b64decode(b64string):
     return base64.b64decode(b64string)
 
+# === Markdown Rendering ===
+# text the parser would only wrap in <p>: no markup characters, no list/heading starts, no edge whitespace
+MARKDOWN_PLAIN_TEXT = re.compile(r"(?![-+\s]|\d+[.)])[^\\`*_\[\]#<>&!~|\t\r\n]*(?<!\s)")
+MARKDOWN_CACHE_SIZE = 4096
+
+_markdown = None  # the parser is built on first use; most startup text takes the fast path
+_markdown_lock = threading.Lock()
+_markdown_fast_path = 0
+
+@functools.lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def _render_markdown(markdown_text):
+    global _markdown
+    with _markdown_lock:
+        if _markdown is None:
+            import markdown
+            _markdown = markdown.Markdown()
+        return _markdown.reset().convert(markdown_text)
+
 def markdown_to_html(markdown_text):
-    html_output = markdown.markdown(markdown_text)
-    return html_output
+    global _markdown_fast_path
+    if markdown_text and MARKDOWN_PLAIN_TEXT.fullmatch(markdown_text):
+        _markdown_fast_path += 1
+        return f"<p>{markdown_text}</p>"
+    with METRICS.time("markdown"):  # only the parser path; the fast path is a regex match
+        return _render_markdown(markdown_text)
+
+def markdown_stats():
+    info = _render_markdown.cache_info()
+    return {"fast_path": _markdown_fast_path, "hits": info.hits, "misses": info.misses, "cached": info.currsize}
+
+# === Scrollback Spool ===
+PLACEHOLDER_SIZE = (300, 169)  # thumbnails are 300px wide; 16:9 until we know better
+class Scrollback:
+    # trimmed console html, newest chunk last, paged back in from the end of the file. History older than
+    # anything in the document goes to a second file, newest first, and is paged in from its front once
+    # the first file is used up; both only ever get appended to
+    def __init__(self, path):
+        self.path = path
+        self.older_path = path + ".older"
+        self.offsets = []
+        self.older = deque()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.clear()
+
+    def __bool__(self):
+        return bool(self.offsets or self.older)
+
+    def __len__(self):
+        return len(self.offsets) + len(self.older)
+
+    def clear(self):
+        self.offsets = []
+        self.older.clear()
+        for path in (self.path, self.older_path):
+            with open(path, "w"):
+                pass
+
+    def remove(self):
+        self.offsets = []
+        self.older.clear()
+        for path in (self.path, self.older_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def push(self, html):
+        with open(self.path, "a", encoding="utf-8") as f:
+            self.offsets.append(f.tell())
+            f.write(json.dumps(html) + "\n")
+
+    def prepend(self, chunks):
+        # older than everything spooled so far, so paged in after it; chunks are oldest first
+        with open(self.older_path, "a", encoding="utf-8") as f:
+            for chunk in reversed(chunks):
+                self.older.append(f.tell())
+                f.write(json.dumps(chunk) + "\n")
+
+    def pop(self):
+        if not self.offsets:
+            with open(self.older_path, "r", encoding="utf-8") as f:
+                f.seek(self.older.popleft())
+                return json.loads(f.readline())
+        offset = self.offsets.pop()
+        with open(self.path, "r+", encoding="utf-8") as f:
+            f.seek(offset)
+            html = json.loads(f.readline())
+            f.truncate(offset)
+        return html
+
+def find_run(messages, run):
+    # (start, end) of the (username, content) pairs in run within messages, searching from the newest end;
+    # the store folds identical rows sent in the same second, so repeats of the row just matched are skipped
+    if not run:
+        return None
+    for end in range(len(messages), 0, -1):
+        if list(messages[end - 1][:2]) != run[-1]:
+            continue
+        i, j = end - 1, len(run) - 1
+        while i >= 0 and j >= 0:
+            row = list(messages[i][:2])
+            if row == run[j]:
+                j -= 1
+            elif j + 1 == len(run) or row != run[j + 1]:
+                break
+            i -= 1
+        if j < 0:
+            return i + 1, end
+    return None
+
+def image_placeholder(url, size):
+    # html twin of ChatClient.placeholder_format; page_in_scrollback turns these back into image slots
+    width, height = size or PLACEHOLDER_SIZE
+    return f'<img src="lazy:{html.escape(url)}" width="{width}" height="{height}">'
+
+def render_spool(messages, image_cache, chunk_size=100):
+    # scrollback html for history that was never put in the document; images load once paged in and scrolled to
+    chunks = []
+    for start in range(0, len(messages), chunk_size):
+        parts = []
+        for username, content, timestamp in messages[start:start + chunk_size]:
+            if content.startswith("[Image] http"):
+                url = content.split(" ", 1)[1]
+                parts.append(f"[{timestamp}] &lt;{username}&gt; sent an image: {url}<br>")
+                parts.append(f"{image_placeholder(url, image_cache.dimensions(url))}<br>")
+            else:
+                parts.append(f"[{timestamp}] &lt;{username}&gt;<br>{markdown_to_html(content.strip())}<br>")
+        chunks.append("".join(parts))
+    return chunks
 
 # === Async Communication Handler ===
 class Communicator(QObject):
-    print_to_console = pyqtSignal(str, object)
-    load_messages = pyqtSignal(list)
-    show_conf = pyqtSignal()
+    print_to_console = pyqtSignal(str)
+    load_messages = pyqtSignal(list, bool)
+    server_named = pyqtSignal(str)
     clear_console = pyqtSignal()
+    image_slot = pyqtSignal(str)  # url
+    image_loaded = pyqtSignal(str, object)
+    upload_progress = pyqtSignal(int, int)
+    latency_updated = pyqtSignal(str)
+    status_changed = pyqtSignal(str, str)
+    send_status = pyqtSignal(int, str)
+    upload_done = pyqtSignal(object)
+    history_older = pyqtSignal(list)
+    history_spooled = pyqtSignal(int, object)
 
 class ConfigWindow(QMainWindow):
     def __init__(self, chat_client):
@@ -188,18 +656,18 @@ class ConfigWindow(QMainWindow):
     def save_config_window(self):
         self.error = False
         try:
-            data = {
-                "client": {
-                    "username": self.username_field.text(),
-                    "font": {"name": self.font_name_field.text(), "size": int(self.font_size_field.text())},
-                    "admin_key": self.adminkey_field.text(),
-                    "soundpack": self.soundpack_field.text()
-                },
-                "server": {
-                    "host": self.host_field.text(),
-                    "port": self.port_field.text()
-                }
-            }
+            # merged into the loaded config, so the sections this window doesn't show ([tabs], [images], ...) survive
+            data = copy.deepcopy(CLI_CONFIG)
+            data["client"].update({
+                "username": self.username_field.text(),
+                "font": {"name": self.font_name_field.text(), "size": int(self.font_size_field.text())},
+                "admin_key": self.adminkey_field.text(),
+                "soundpack": self.soundpack_field.text()
+            })
+            data["server"].update({
+                "host": self.host_field.text(),
+                "port": int(self.port_field.text())
+            })
         except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
             self.error = True
@@ -211,7 +679,7 @@ class ConfigWindow(QMainWindow):
             exit()
 
 class LoadingWindow(QMainWindow):
-    def __init__(self, messages, chat_client):
+    def __init__(self, messages, chat_client, replace=True):
         super().__init__()
 
         self.chat = chat_client
@@ -238,40 +706,150 @@ class LoadingWindow(QMainWindow):
         self.setCentralWidget(container)
 
         self.idx = 0
+        self.cancelled = False
         
-        self.chat.clear_console()
+        if replace:
+            self.chat.clear_console()
         
         QTimer.singleShot(0, self.process_messages)
 
     def process_messages(self):
+        # images go in as placeholders; the console loads the ones that end up near the viewport
         for self.idx, message in enumerate(self.messages):
-            message = self.messages[self.idx]
+            if self.cancelled:
+                self.close()  # the tab was closed meanwhile
+                return
             username, content, timestamp = message
-            if content.startswith("[Image] http"):
-                url = content.split(" ", 1)[1]
-                try:
-                    image_req = requests.get(url)
-                    if image_req.ok:
-                        image_data = image_req.content
-                        pixmap = QPixmap()
-                        pixmap.loadFromData(image_data)
-                        pixmap = pixmap.scaledToWidth(300, Qt.SmoothTransformation)
-                        self.chat.comm.print_to_console.emit(f"[{timestamp}] &lt;{username}&gt; sent an image: {url}", None)
-                        self.chat.comm.print_to_console.emit("", pixmap)
-                    else:
-                        self.chat.comm.print_to_console.emit(f"<p style='color: #ff5555;'>[{timestamp}] &lt;{username}&gt; sent an image but it failed to load (error {image_req.status_code})</p>", None)
-                except Exception as e:
-                    self.chat.comm.print_to_console.emit("Failed to load image.", None)
-                    log(f"Image load error: {e}")
-            else:
-                html = markdown_to_html(content.strip())
-                self.chat.comm.print_to_console.emit(f"[{timestamp}] &lt;{username}&gt;", None)
-                self.chat.comm.print_to_console.emit(html, None)
+            self.chat.render_message(username, content, timestamp)
             self.progress.setValue(self.idx + 1)
-            log(f"loaded message {self.idx}")
+            log(f"loaded message {self.idx}", logging.DEBUG)
             QCoreApplication.processEvents()
 
+        log(f"Markdown render stats: {markdown_stats()}")
         self.close()
+        self.chat.finish_loading()
+
+class SearchWindow(QMainWindow):
+    def __init__(self, chat_client, query):
+        super().__init__()
+
+        self.chat = chat_client
+        self.setWindowTitle(f"Search: {query}")
+        self.setStyleSheet("background-color: black; color: white;")
+        self.resize(600, 400)
+
+        layout = QVBoxLayout()
+
+        start = time.perf_counter()
+        results = self.chat.message_store.search(query)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self.summary_label = QLabel(f"{len(results)} results in {elapsed:.1f}ms", self)
+        layout.addWidget(self.summary_label)
+
+        self.results = QTextEdit(self)
+        self.results.setReadOnly(True)
+        self.results.setUndoRedoEnabled(False)
+        self.results.setStyleSheet("background-color: #232323; color: white")
+        self.results.setHtml("".join(
+            f"<p>[{html.escape(timestamp)}] &lt;{html.escape(result_username)}&gt; "
+            f"<span style='color: #808080;'>({html.escape(server)})</span><br>{html.escape(content)}</p>"
+            for server, result_username, content, timestamp in results))
+        layout.addWidget(self.results)
+
+        container = QWidget(self)
+        container.setLayout(layout)
+        self.setCentralWidget(container)
+
+class DebugWindow(QMainWindow):
+    # live view of clientCore.METRICS: per-stage latency histograms, queue depths and document size
+    SPARKS = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, chat_client):
+        super().__init__()
+
+        self.chat = chat_client
+        self.setWindowTitle("Debug")
+        self.setStyleSheet("background-color: black; color: white;")
+        self.resize(820, 560)
+        self.previous = {}
+
+        layout = QVBoxLayout()
+
+        self.view = QTextEdit(self)
+        self.view.setReadOnly(True)
+        self.view.setUndoRedoEnabled(False)
+        self.view.setStyleSheet("background-color: #232323; color: white")
+        layout.addWidget(self.view)
+
+        button_layout = QHBoxLayout()
+        for label, name in (("Export JSON", "gichat-metrics.json"), ("Export Prometheus", "gichat.prom")):
+            button = QPushButton(label, self)
+            button.clicked.connect(functools.partial(self.export, name))
+            button.setStyleSheet("background-color: #424242; color: white; border-radius: 1px; padding: 8px 10px;")
+            button_layout.addWidget(button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        container = QWidget(self)
+        container.setLayout(layout)
+        self.setCentralWidget(container)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def sparkline(self, counts):
+        peak = max(counts)
+        return "".join(self.SPARKS[0 if not count else max(1, round(count / peak * 8))] for count in counts) if peak else " " * len(counts)
+
+    def refresh(self):
+        snapshot = METRICS.snapshot()
+        ms = lambda seconds: "-" if seconds is None else f"{seconds * 1000:.2f}"
+        # the "last second" column is the difference since the previous refresh, the other one the whole session
+        rows = [f"{'stage':<15}{'count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  "
+                f"{'last second':<{len(METRIC_BUCKETS) + 1}}  session",
+                f"{'':<64}  100µs{'':>{len(METRIC_BUCKETS) - 8}}10s+"]
+        for stage, histogram in sorted(snapshot["stages"].items()):
+            previous = self.previous.get(stage, [0] * len(histogram["buckets"]))
+            recent = [count - before for count, before in zip(histogram["buckets"], previous)]
+            self.previous[stage] = histogram["buckets"]
+            rows.append(f"{stage:<15}{histogram['count']:>9}{ms(histogram['p50']):>10}{ms(histogram['p95']):>10}"
+                        f"{ms(histogram['p99']):>10}{ms(histogram['max']):>10}  {self.sparkline(recent)}  "
+                        f"{self.sparkline(histogram['buckets'])}")
+        rows.append("")
+        rows += [f"{name:<24}{value:>12}" for name, value in sorted(snapshot["gauges"].items())]
+        rows.append("")
+        rows += [f"{name:<24}{value:>12}" for name, value in sorted(snapshot["counters"].items())]
+        scrollbar = self.view.verticalScrollBar()
+        position = scrollbar.value()
+        self.view.setHtml(f"<pre>{html.escape(chr(10).join(rows))}</pre>")
+        scrollbar.setValue(position)
+
+    def export(self, name):
+        path, _ = QFileDialog.getSaveFileName(self, "Export metrics", name, "Metrics (*.json *.prom);;All files (*)")
+        if path:
+            try:
+                METRICS.export(path)
+            except OSError as e:
+                QMessageBox.critical(self, "Export failed", str(e))
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
+
+class ConsoleView(QTextEdit):
+    # images that aren't loaded are named "lazy:<url>" and all draw as one grey pixmap, scaled to their format's size
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.placeholder = QPixmap(1, 1)
+        self.placeholder.fill(QColor("#333333"))
+
+    def loadResource(self, kind, name):
+        if name.toString().startswith("lazy:"):
+            return self.placeholder
+        return super().loadResource(kind, name)
 
 class ChatInput(QTextEdit):
     enter_pressed = pyqtSignal()
@@ -286,44 +864,303 @@ class ChatInput(QTextEdit):
         else:
             super().keyPressEvent(event)
 
-class ChatClient(QMainWindow):
-    def __init__(self):
+# === Core Bridge ===
+class GuiCore(ChatCore):
+    # the core's hooks run on the asyncio thread, so everything that touches widgets goes through signals
+    STATUS_COLORS = {"connecting": "#ffcc00", "connected": "#00ff00", "offline": "red"}
+
+    def __init__(self, tab, config, store=None, executor=None):
+        super().__init__(config, store, executor)
+        self.tab = tab
+
+    def on_status(self, text, state):
+        self.tab.comm.status_changed.emit(text, self.STATUS_COLORS[state])
+
+    def on_connected(self, server_info, online_users):
+        playeventsound("connect")
+        self.tab.comm.server_named.emit(server_info["name"])
+        self.tab.comm.print_to_console.emit(f"Connected to &quot;{server_info['name']}&quot; ({self.uri})")
+        if type(online_users) == list:
+            users = ", ".join(online_users)
+            self.tab.comm.print_to_console.emit("Online Users: " + users + "<br>")
+
+    def on_connect_failed(self, error):
+        self.tab.comm.print_to_console.emit(f"<p style='color: #ff5555;'> Connection failed: {error}</p>")
+        playerror()
+
+    def on_history(self, messages, replace):
+        self.tab.comm.load_messages.emit(messages, replace)
+
+    def on_history_older(self, messages):
+        self.tab.comm.history_older.emit(messages)
+
+    def prepare(self, data):
+        # receive worker: markdown is the expensive part of showing a message
+        if data.get("type") == "msg" and data.get("event") not in ("request", "srv_message", "srv_command"):
+            message = data["message"]
+            if not message.startswith(("[Image] http", "[File] http")):
+                return markdown_to_html(message)
+        return None
+
+    def on_message(self, data, timestamp, prepared=None):
+        comm = self.tab.comm
+        if data["type"] == "msg" and not data["event"] == "request":
+            message = data['message']
+            if message.startswith("[Image] http"):
+                url = message.split(" ", 1)[1]
+                comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt; sent an image: {url}")
+                self.tab.show_image(url)
+            elif message.startswith("[File] http"):
+                url = message.split(" ", 1)[1]
+                comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt; sent an file: {url}")
+            else:
+                msg_html = prepared if prepared is not None else markdown_to_html(message)
+                comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt;")
+                comm.print_to_console.emit(msg_html)
+        playeventsound("rcv_message")
+
+    def on_server_message(self, data, timestamp):
+        self.tab.comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt;")
+        self.tab.comm.print_to_console.emit(data['message'] + "<br>")
+        if "join" in data['message']:
+            playeventsound("user_join")
+        elif "left" in data['message']:
+            playeventsound("user_leave")
+
+    def on_server_command(self, command, timestamp):
+        if command == "CLEAR_MESSAGE_DB":
+            self.tab.comm.clear_console.emit()
+            self.tab.comm.print_to_console.emit(f"[{timestamp}] &lt;server&gt;")
+            self.tab.comm.print_to_console.emit("Message DB was cleared.")
+
+    def on_disconnected(self, reason):
+        if reason == "client":
+            playeventsound("disconnect")
+        elif reason == "kick":
+            playeventsound("kicked")
+        self.tab.comm.print_to_console.emit("Disconnected.")
+
+    def on_send_status(self, entry, state):
+        if state == "sent":
+            playeventsound("send_message")
+        self.tab.comm.send_status.emit(entry["id"], state)
+
+    def on_latency(self):
+        self.tab.comm.latency_updated.emit(self.latency.summary() if self.latency_task else "")
+
+    def on_notice(self, text):
+        self.tab.comm.print_to_console.emit(text)
+
+# === Server Tabs ===
+def parse_server(text, default_port=8765):
+    # "host:port" or just "host"; raises ValueError for anything else
+    host, _, port = text.strip().partition(":")
+    if not host:
+        raise ValueError(f"no host in {text!r}")
+    return host, int(port) if port else default_port
+
+class ServerTab(QWidget):
+    # one server connection and its console. The loop, the pools, the HTTP client, the caches and the message
+    # store belong to the ChatClient and are shared by every tab. A tab that isn't showing only queues what it
+    # would draw: console entries and history wait until it's switched to
+    def __init__(self, client, host, port, number):
         super().__init__()
 
-        self.websocket = None
-        self.loop = asyncio.new_event_loop()
-        self.shutdown_flag = False
+        self.client = client
+        self.loop = client.loop
+        self.image_cache = client.image_cache
+        self.message_store = client.message_store
+        self.address = f"{host}:{port}"
+        self.core = GuiCore(self, dict(CLI_CONFIG, server={"host": host, "port": port}), client.message_store,
+                            client.receive_pool)
+        self.status_slots = {}
+        self.image_slots = {}
+        self.image_loading = set()
+        self.image_refs = {}
+        self.image_bytes = {}
+        self.console_queue = []
+        self.console_following = True
+        self.console_generation = 0
+        self.scrollback = Scrollback(os.path.join(client.spool_dir, f"scrollback-{number}.jsonl"))
+        self.cached_history = []
+        self.history_loading = False
+        self.spool_backlog = []
+        self.pending_history = None
+        self.held_console = None  # a list while a history is pending or loading: live entries wait behind it
+        self.active = False
+        self.shown = False
+        self.unread = False
 
         self.comm = Communicator()
         self.comm.print_to_console.connect(self.print_to_console)
         self.comm.load_messages.connect(self.show_loading_window)
-        self.comm.show_conf.connect(self.show_config_window)
-        
-        
-        self.init_ui()
-        
-        self.comm.clear_console.connect(self.console.clear)
+        self.comm.image_slot.connect(self.insert_image_slot)
+        self.comm.image_loaded.connect(self.fill_image_slot)
+        self.comm.upload_progress.connect(self.update_upload_progress)
+        self.comm.upload_done.connect(self.finish_upload)
+        self.comm.history_older.connect(self.spool_history)
+        self.comm.history_spooled.connect(self.prepend_scrollback)
+        self.comm.server_named.connect(lambda name: self.client.name_tab(self, name))
 
-        threading.Thread(target=self.start_asyncio_loop, daemon=True).start()
+        self.init_ui()
 
-    def show_loading_window(self, messages):
-        self.loading_window = LoadingWindow(messages, self)
-        self.loading_window.show()
-    
-    def show_config_window(self):
-        self.conf_window = ConfigWindow(self)
-        self.conf_window.show()
+        self.comm.clear_console.connect(self.reset_console)
+        self.comm.latency_updated.connect(self.latency_label.setText)
+        self.comm.status_changed.connect(self.show_status)
+        self.comm.send_status.connect(self.update_send_status)
+
+        self.loop.call_soon_threadsafe(self.core.start)
+
+    def shutdown(self):
+        # the tab is being closed: nothing may draw into it any more, including signals already on their way
+        self.comm.blockSignals(True)
+        for name, value in vars(Communicator).items():
+            if isinstance(value, pyqtSignal):
+                getattr(self.comm, name).disconnect()
+        if getattr(self, "loading_window", None) is not None:
+            self.loading_window.cancelled = True
+        self.console_timer.stop()
+        self.image_timer.stop()
+        self.scrollback.remove()
+        asyncio.run_coroutine_threadsafe(self.core.close(), self.loop)
+
+    def set_active(self, active):
+        self.active = active
+        if not active:
+            return
+        self.unread = False
+        if not self.shown:
+            self.shown = True
+            # a history that came in while the tab was in the background is newer than the cached tail anyway
+            if self.pending_history is None:
+                self.show_cached_history()
+        if self.pending_history is not None:
+            self.load_pending_history()
+        if self.console_queue:
+            self.console_timer.start()
+        elif self.image_slots:
+            self.image_timer.start()
+        self.message_input.setFocus()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.image_slots:
+            self.image_timer.start()
+
+    def show_cached_history(self):
+        # the tail of what we saw last session, drawn before the connection is up; the server's history
+        # reconciles with it in show_loading_window
+        limit = CLI_CONFIG.get("startup", {}).get("cached_messages", 200)
+        self.cached_history = [list(message) for message in self.message_store.recent(self.core.uri, limit)] if limit else []
+        for username, content, timestamp in self.cached_history:
+            self.render_message(username, content, timestamp)
+        if self.cached_history:
+            log(f"Showing {len(self.cached_history)} cached messages from {self.core.uri} until the server's history arrives")
+
+    def render_message(self, username, content, timestamp):
+        # history, so it goes ahead of the live entries held back meanwhile
+        if content.startswith("[Image] http"):
+            url = content.split(" ", 1)[1]
+            self.queue_console(("print", f"[{timestamp}] &lt;{username}&gt; sent an image: {url}"), history=True)
+            self.queue_console(("slot", url), history=True)
+        else:
+            self.queue_console(("print", f"[{timestamp}] &lt;{username}&gt;"), history=True)
+            self.queue_console(("print", markdown_to_html(content.strip())), history=True)
+
+    def show_loading_window(self, messages, replace):
+        self.history_loading = True
+        if not self.active:
+            # kept until the tab is shown; what arrives meanwhile is held behind it. A full reload makes the
+            # held entries moot, a delta just joins the one already waiting
+            if self.pending_history is None or replace:
+                self.pending_history = (messages, replace)
+                self.held_console = []
+            else:
+                self.pending_history = (self.pending_history[0] + messages, self.pending_history[1])
+            return
+        self.load_history(messages, replace)
+
+    def load_pending_history(self):
+        messages, replace = self.pending_history
+        self.pending_history = None
+        self.load_history(messages, replace)
+
+    def load_history(self, messages, replace):
+        if replace and self.cached_history:
+            messages, replace = self.reconcile_history(messages)
+            if not messages:
+                self.finish_loading()
+                return
+        if self.active:
+            self.loading_window = LoadingWindow(messages, self, replace)
+            self.loading_window.show()
+            return
+        # a background tab that overflowed its backlog: no loading window for a tab nobody is looking at
+        if replace:
+            self.reset_console()
+        for message in messages:
+            self.render_message(*message)
+        self.finish_loading()
+
+    def reconcile_history(self, messages):
+        cached = [message[:2] for message in self.cached_history]
+        self.cached_history = []
+        match = find_run(messages, cached)
+        if match is None:
+            log("Cached history is not part of the server's history, reloading")
+            return messages, True
+        older, newer = messages[:match[0]], messages[match[1]:]
+        log(f"Cached history matches the server's: {len(newer)} new messages, {len(older)} older ones spooled "
+            f"({(time.perf_counter() - STARTED) * 1000:.0f}ms after start)")
+        if older:
+            self.spool_history(older)
+        return newer, False
+
+    def finish_loading(self):
+        self.history_loading = False
+        held, self.held_console = self.held_console, None
+        for entry in held or ():
+            self.queue_console(entry)
+        backlog, self.spool_backlog = self.spool_backlog, []
+        for messages in backlog:
+            self.spool_history(messages)
+
+    def spool_history(self, messages):
+        # history older than the console goes straight to the scrollback spool, rendered off the GUI thread.
+        # Held back while the loading window runs: the spool thread's markdown would take the GIL from it
+        if self.history_loading:
+            self.spool_backlog.append(messages)
+            return
+        generation = self.console_generation
+        future = self.client.spool_pool.submit(render_spool, messages, self.image_cache)
+        future.add_done_callback(lambda future: self.comm.history_spooled.emit(generation, future.exception() or future.result()))
+
+    def prepend_scrollback(self, generation, chunks):
+        if generation != self.console_generation:
+            return  # the console was cleared meanwhile
+        if not isinstance(chunks, list):
+            log(f"Could not spool older history: {chunks}", logging.WARNING)
+            return
+        self.scrollback.prepend(chunks)
 
     def init_ui(self):
-        self.setWindowTitle(f"GIchat Client {CLI_VERSION}")
-        self.setStyleSheet("background-color: #000000; color: white")
-        self.setGeometry(100, 100, 900, 500)
-        self.setWindowIcon(QIcon("assets/images/GIchat_Icon.ico"))
-
-        self.console = QTextEdit(self)
+        self.console = ConsoleView(self)
         self.console.setReadOnly(True)
         self.console.setFont(QFont(CLI_CONFIG["client"]["font"]["name"], CLI_CONFIG["client"]["font"]["size"]))
         self.console.setStyleSheet("background-color: #232323; color: white")
+        self.console.setUndoRedoEnabled(False)
+        self.console.verticalScrollBar().valueChanged.connect(self.console_scrolled)
+
+        self.console_timer = QTimer(self)
+        self.console_timer.setSingleShot(True)
+        self.console_timer.setInterval(CLI_CONFIG.get("console", {}).get("flush_interval_ms", 16))
+        self.console_timer.timeout.connect(self.flush_console)
+
+        # coalesces scrolls, resizes and flushes into one pass over the image slots
+        self.image_timer = QTimer(self)
+        self.image_timer.setSingleShot(True)
+        self.image_timer.setInterval(30)
+        self.image_timer.timeout.connect(self.update_images)
 
         self.message_input = ChatInput(self)
         self.message_input.setFixedHeight(50)
@@ -337,6 +1174,21 @@ class ChatClient(QMainWindow):
         self.server_status_dot.setFixedSize(10, 10)
         self.server_status_dot.setStyleSheet("background-color: red; border-radius: 5px;")
 
+        self.latency_label = QLabel("", self)
+        self.latency_label.setStyleSheet("background-color: #000000; color: #808080")
+
+        self.upload_progress = QProgressBar(self)
+        self.upload_progress.setStyleSheet("QProgressBar {color: white; background-color: #333;} QProgressBar::chunk {background-color: #05B8CC;}")
+        self.upload_progress.setFixedWidth(150)
+        self.upload_progress.setFormat("Uploading %p%")
+        self.upload_progress.hide()
+
+        self.search_field = QLineEdit(self)
+        self.search_field.setPlaceholderText("Search history...")
+        self.search_field.setFixedWidth(200)
+        self.search_field.setStyleSheet("background-color: #232323; color: white")
+        self.search_field.returnPressed.connect(lambda: self.client.show_search_window(self.search_field.text().strip()))
+
         send_button = QPushButton(">", self)
         send_button.clicked.connect(self.send_message)
         send_button.setFixedWidth(50)
@@ -351,15 +1203,15 @@ class ChatClient(QMainWindow):
         ping_button.setStyleSheet("background-color: #424242; color: white; border-radius: 1px; padding: 8px 10px;")
 
         clear_button = QPushButton("Clear", self)
-        clear_button.clicked.connect(lambda: self.console.clear())
+        clear_button.clicked.connect(self.reset_console)
         clear_button.setStyleSheet("background-color: #424242; color: white; border-radius: 1px; padding: 8px 10px;")
 
         disconnect_button = QPushButton("Disconnect", self)
-        disconnect_button.clicked.connect(lambda: asyncio.run_coroutine_threadsafe(self.disconnect(reason="client"), self.loop))
+        disconnect_button.clicked.connect(lambda: asyncio.run_coroutine_threadsafe(self.core.disconnect(reason="client"), self.loop))
         disconnect_button.setStyleSheet("background-color: #424242; color: white; border-radius: 1px; padding: 8px 10px;")
 
         reconnect_button = QPushButton("Reconnect", self)
-        reconnect_button.clicked.connect(lambda: asyncio.run_coroutine_threadsafe(self.reconnect(), self.loop))
+        reconnect_button.clicked.connect(lambda: asyncio.run_coroutine_threadsafe(self.core.reconnect(), self.loop))
         reconnect_button.setStyleSheet("background-color: #424242; color: white; border-radius: 1px; padding: 8px 10px;")
 
         # Layouts
@@ -381,16 +1233,548 @@ class ChatClient(QMainWindow):
         status_layout = QHBoxLayout()
         status_layout.addWidget(self.server_status_dot)
         status_layout.addWidget(self.server_status_label)
+        status_layout.addWidget(self.latency_label)
         status_layout.addStretch()
+        status_layout.addWidget(self.upload_progress)
+        status_layout.addWidget(self.search_field)
 
-        central_widget = QWidget()
         central_layout = QVBoxLayout()
         central_layout.addLayout(status_layout)
         central_layout.addLayout(main_layout)
         central_layout.addLayout(message_layout)
-        central_widget.setLayout(central_layout)
+        self.setLayout(central_layout)
+
+    def print_to_console(self, text):
+        self.queue_console(("print", text))
+
+    def insert_image_slot(self, url):
+        self.queue_console(("slot", url))
+
+    def queue_console(self, entry, history=False):
+        if self.held_console is not None and not history:
+            self.held_console.append(entry)  # newer than the history that's still waiting to be drawn
+        else:
+            self.console_queue.append(entry)
+        if not self.active:
+            # drawn once the tab is shown; a room busy enough to fill the backlog gets drawn in one batch anyway
+            self.client.mark_unread(self)
+            if len(self.console_queue) + len(self.held_console or ()) >= CLI_CONFIG.get("console", {}).get("background_backlog", 5000):
+                if self.pending_history is not None:
+                    self.load_pending_history()
+                self.flush_console()
+        elif len(self.console_queue) >= CLI_CONFIG.get("console", {}).get("max_batch", 500):
+            self.flush_console()
+        elif not self.console_timer.isActive():
+            self.console_timer.start()
+
+    def flush_console(self):
+        # one edit block and one scroll per batch instead of a relayout per fragment
+        self.console_timer.stop()
+        if not self.console_queue:
+            return
+        pending, self.console_queue = self.console_queue, []
+        start = time.perf_counter()
+        cursor = QTextCursor(self.console.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for entry in pending:
+            if entry[0] == "slot":
+                self._insert_image_slot(cursor, entry[1])
+            elif entry[0] == "status":
+                self._insert_status_slot(cursor, entry[1], entry[2])
+            else:
+                self._insert_print(cursor, entry[1])
+        cursor.endEditBlock()
+        # only trim and scroll while following the bottom, so reading older messages is not disturbed
+        if self.console_following:
+            self.trim_scrollback()
+            self.console.moveCursor(QTextCursor.End)
+        METRICS.observe("console_insert", time.perf_counter() - start)
+        METRICS.count("console_entries", len(pending))
+        if self.image_slots:
+            self.image_timer.start()
+
+    def _insert_print(self, cursor, text):
+        if text:
+            cursor.insertHtml(text + "<br>")
+
+    def _insert_status_slot(self, cursor, entry_id, header):
+        marker = "(sending...)"
+        cursor.insertHtml(header + " ")
+        start = cursor.position()
+        cursor.insertHtml(f"<span style='color: #808080;'>{marker}</span>")
+        slot = QTextCursor(cursor)
+        slot.setPosition(start)
+        slot.setPosition(cursor.position(), QTextCursor.KeepAnchor)
+        slot.setKeepPositionOnInsert(True)
+        self.status_slots[entry_id] = slot
+        cursor.insertHtml("<br>")
+
+    def update_send_status(self, entry_id, state):
+        if entry_id not in self.status_slots:
+            self.flush_console()  # the marker may still be waiting in the append queue
+        slot = self.status_slots.pop(entry_id, None)
+        if slot is None:
+            return
+        if state == "sent":
+            slot.removeSelectedText()
+        else:
+            slot.insertHtml("<span style='color: #ff5555;'>(failed to send)</span>")
+
+    def submit_image(self, url):
+        # fetch on the i/o pool, then decode and scale on the decode pool; the returned future yields (digest, QImage)
+        decoded = Future()
+
+        def fetched(future):
+            if future.exception() is not None:
+                decoded.set_exception(future.exception())
+                return
+            digest, data, validators = future.result()
+            stage = self.client.decode_pool.submit(decode_image, self.image_cache, url, digest, data, validators=validators)
+            stage.add_done_callback(lambda stage: decoded.set_exception(stage.exception()) if stage.exception()
+                                    else decoded.set_result(stage.result()))
+
+        timeout = CLI_CONFIG.get("images", {}).get("timeout", 10)
+        asyncio.run_coroutine_threadsafe(read_image(self.client.http, self.image_cache, self.client.image_pool, url, timeout, None),
+                                         self.loop).add_done_callback(fetched)
+        return decoded
+
+    def show_image(self, url):
+        # safe to call from any thread; the placeholder goes in through a queued signal
+        self.comm.image_slot.emit(url)
+
+    # every image in the console is a slot: a one-character selection over either a "lazy:" placeholder or
+    # the loaded thumbnail. Slots near the viewport get loaded, loaded ones far from it are turned back into
+    # placeholders when the decoded images outgrow their budget.
+    def placeholder_format(self, url, size):
+        image_format = QTextImageFormat()
+        image_format.setName(f"lazy:{url}")
+        image_format.setWidth(size[0])
+        image_format.setHeight(size[1])
+        return image_format
+
+    def _insert_image_slot(self, cursor, url):
+        cursor.insertText("\n")
+        size = self.image_cache.dimensions(url) or PLACEHOLDER_SIZE
+        cursor.insertImage(self.placeholder_format(url, size))
+        self.add_image_slot(cursor.position() - 1, url, size)
+        cursor.insertText("\n")
+
+    def add_image_slot(self, position, url, size):
+        slot = QTextCursor(self.console.document())
+        slot.setPosition(position)
+        slot.setPosition(position + 1, QTextCursor.KeepAnchor)
+        slot.setKeepPositionOnInsert(True)  # appends right behind the image must not grow the selection
+        self.image_slots[str(uuid.uuid4())] = {"cursor": slot, "url": url, "size": size, "digest": None}
+
+    def replace_slot_image(self, slot, image_format):
+        cursor = slot["cursor"]
+        position = cursor.selectionStart()
+        cursor.insertImage(image_format)
+        cursor.setPosition(position)
+        cursor.setPosition(position + 1, QTextCursor.KeepAnchor)
+
+    def update_images(self):
+        if not self.image_slots or not self.active:
+            return
+        image_config = CLI_CONFIG.get("images", {})
+        layout = self.console.document().documentLayout()
+        viewport = self.console.viewport().height()
+        scroll = self.console.verticalScrollBar().value()
+        margin = viewport * image_config.get("prefetch_screens", 3)
+        top, bottom = scroll - margin, scroll + viewport + margin
+        far = []
+        for slot_id, slot in self.image_slots.items():
+            rect = layout.blockBoundingRect(slot["cursor"].block())
+            near = rect.bottom() >= top and rect.top() <= bottom
+            if near and slot["digest"] is None and slot_id not in self.image_loading:
+                self.load_image_slot(slot_id, slot["url"])
+            elif not near and slot["digest"] is not None:
+                far.append((min(abs(rect.top() - scroll), abs(rect.bottom() - scroll - viewport)), slot_id))
+        budget = image_config.get("decoded_cache_mb", 64) * 1024 * 1024
+        if sum(self.image_bytes.values()) > budget:
+            # farthest first, down to 80% so scrolling back and forth doesn't evict on every pass
+            for _, slot_id in sorted(far, reverse=True):
+                self.unload_image_slot(self.image_slots[slot_id])
+                if sum(self.image_bytes.values()) <= budget * 0.8:
+                    break
+
+    def load_image_slot(self, slot_id, url):
+        self.image_loading.add(slot_id)
+        future = self.submit_image(url)
+        future.add_done_callback(lambda future: self.comm.image_loaded.emit(slot_id, future.exception() or future.result()))
+
+    def unload_image_slot(self, slot):
+        self.replace_slot_image(slot, self.placeholder_format(slot["url"], slot["size"]))
+        self.release_image(slot["digest"])
+        slot["digest"] = None
+        METRICS.count("images_unloaded")
+
+    def fill_image_slot(self, slot_id, result):
+        if slot_id not in self.image_loading:
+            return  # trimmed or cleared while loading
+        self.image_loading.discard(slot_id)
+        slot = self.image_slots[slot_id]
+        if not isinstance(result, tuple):
+            slot["cursor"].insertHtml("<span style='color: #ff5555;'>Failed to load image.</span>")
+            del self.image_slots[slot_id]
+            log(f"Image load error: {result}", logging.WARNING)
+            return
+        digest, image = result
+        self.acquire_image(digest, image)
+        old_height = slot["size"][1]
+        rect = self.console.document().documentLayout().blockBoundingRect(slot["cursor"].block())
+        image_format = QTextImageFormat()
+        image_format.setName(digest)
+        self.replace_slot_image(slot, image_format)
+        slot["digest"], slot["size"] = digest, (image.width(), image.height())
+        # keep what's on screen in place when an image above it turns out taller or shorter than its placeholder
+        scrollbar = self.console.verticalScrollBar()
+        if not self.console_following and rect.top() < scrollbar.value():
+            scrollbar.setValue(scrollbar.value() + image.height() - old_height)
+
+    # identical images share one document resource named by content hash, released when no block uses it
+    def acquire_image(self, digest, image):
+        if self.image_refs.get(digest, 0) == 0:
+            self.console.document().addResource(QTextDocument.ImageResource, QUrl(digest), QPixmap.fromImage(image))
+            self.image_bytes[digest] = image.width() * image.height() * 4
+        self.image_refs[digest] = self.image_refs.get(digest, 0) + 1
+
+    def release_image(self, digest):
+        refs = self.image_refs.get(digest, 0) - 1
+        if refs > 0:
+            self.image_refs[digest] = refs
+            return
+        self.image_refs.pop(digest, None)
+        self.image_bytes.pop(digest, None)
+        # QTextDocument has no removeResource; replacing the entry with a null pixmap frees the image data
+        self.console.document().addResource(QTextDocument.ImageResource, QUrl(digest), QPixmap())
+
+    def trim_scrollback(self):
+        document = self.console.document()
+        console_config = CLI_CONFIG.get("console", {})
+        max_blocks = console_config.get("scrollback_blocks", 5000)
+        max_chars = console_config.get("scrollback_chars", 2000000)
+        if document.blockCount() <= max_blocks and document.characterCount() <= max_chars:
+            return
+        # trim down to 80% so a busy room does not trim on every flush
+        cut_block = document.findBlockByNumber(max(0, document.blockCount() - int(max_blocks * 0.8)))
+        cut = max(cut_block.position(), document.findBlock(document.characterCount() - int(max_chars * 0.8)).position())
+        if cut <= 0:
+            return
+
+        # spooled images go out as placeholders, so the spool holds no pixmaps and page-in finds them as slots
+        for slot_id, slot in list(self.image_slots.items()):
+            if slot["cursor"].selectionStart() < cut:
+                if slot["digest"] is not None:
+                    self.unload_image_slot(slot)
+                self.image_loading.discard(slot_id)
+                del self.image_slots[slot_id]
+        for slot_id, slot in list(self.status_slots.items()):
+            if slot.selectionStart() < cut:
+                del self.status_slots[slot_id]
+
+        cursor = QTextCursor(document)
+        cursor.setPosition(cut, QTextCursor.KeepAnchor)
+        self.scrollback.push(cursor.selection().toHtml())
+        cursor.removeSelectedText()
+
+    def console_scrolled(self, value):
+        self.console_following = value >= self.console.verticalScrollBar().maximum() - 4
+        if value == 0 and self.scrollback:
+            self.page_in_scrollback()
+        if self.image_slots:
+            self.image_timer.start()
+
+    def page_in_scrollback(self):
+        html = self.scrollback.pop()
+        document = self.console.document()
+        scrollbar = self.console.verticalScrollBar()
+        old_maximum = scrollbar.maximum()
+        old_length = document.characterCount()
+        cursor = QTextCursor(document)
+        cursor.insertHtml(html)
+        inserted = document.characterCount() - old_length
+        block = document.begin()
+        while block.isValid() and block.position() < inserted:
+            fragments = block.begin()
+            while not fragments.atEnd():
+                fragment = fragments.fragment()
+                image_format = fragment.charFormat().toImageFormat()
+                if image_format.isValid() and image_format.name().startswith("lazy:"):
+                    self.add_image_slot(fragment.position(), image_format.name()[5:],
+                                        (round(image_format.width()), round(image_format.height())))
+                fragments += 1
+            block = block.next()
+        scrollbar.setValue(scrollbar.maximum() - old_maximum)
+
+    def reset_console(self):
+        self.console_generation += 1
+        self.console_queue.clear()
+        self.image_slots.clear()
+        self.image_loading.clear()
+        self.status_slots.clear()
+        self.scrollback.clear()
+        self.image_refs.clear()
+        self.image_bytes.clear()
+        self.console.clear()
+        self.console_following = True
+
+    def clear_console(self):
+        self.comm.clear_console.emit()
+    
+    def ping_server(self):
+        stats = self.core.latency.stats()
+        if stats:
+            QMessageBox.information(self, "Ping Successful",
+                                    f"Response Time: {round(stats['last'], 2)}ms\n"
+                                    f"Min: {round(stats['min'], 2)}ms\n"
+                                    f"Avg: {round(stats['avg'], 2)}ms\n"
+                                    f"P95: {round(stats['p95'], 2)}ms\n"
+                                    f"Jitter: {round(stats['jitter'], 2)}ms\n"
+                                    f"({stats['samples']} samples, {stats['failures']} timeouts)")
+        else:
+            QMessageBox.critical(self, "Ping Failed", "No round trips measured yet" if self.core.websocket else "Not connected")
+
+    def show_status(self, text, color):
+        self.server_status_label.setText(text)
+        self.server_status_dot.setStyleSheet(f"background-color: {color}; border-radius: 5px;")
 
-        self.setCentralWidget(central_widget)
+    def send_message(self):
+        msg = self.message_input.toPlainText().strip()
+        if msg:
+            self.message_input.clear()
+            self.queue_outgoing(msg)
+
+    def queue_outgoing(self, msg):
+        # shown right away as pending; the core sends in order whenever the connection is up
+        entry = self.core.queue_message(msg)
+        entry_id = entry["id"] if entry else -next(self.core.outbox.ids)
+        timestamp = timestamp_now()
+        if msg.startswith("[Image] http"):
+            url = msg.split(" ", 1)[1]
+            self.queue_console(("status", entry_id, f"[{timestamp}] &lt;{self.core.username}&gt; sent an image: {url}"))
+            self.show_image(url)
+        else:
+            self.queue_console(("status", entry_id, f"[{timestamp}] &lt;{self.core.username}&gt;"))
+            self.print_to_console(markdown_to_html(msg))
+        if entry is None:
+            self.update_send_status(entry_id, "failed")
+            playerror()
+
+    def send_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select a file", "", "Image files (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff *.xpm *.ico)")
+        if file_path:
+            upload_config = CLI_CONFIG.get("uploads", {})
+            self.upload_progress.setValue(0)
+            self.upload_progress.show()
+            future = asyncio.run_coroutine_threadsafe(
+                upload_image(self.client.http, self.image_cache, self.client.image_pool, f"http://{self.core.host}:8000/upload",
+                             file_path, upload_config.get("max_dimension", 2048), upload_config.get("timeout", 60),
+                             self.comm.upload_progress.emit), self.loop)
+            future.add_done_callback(lambda future: self.comm.upload_done.emit(future.exception() or future.result()))
+
+    def update_upload_progress(self, sent, total):
+        self.upload_progress.setMaximum(total)
+        self.upload_progress.setValue(sent)
+
+    def finish_upload(self, result):
+        self.upload_progress.hide()
+        if isinstance(result, str):
+            self.queue_outgoing(f"[Image] {result}")
+        else:
+            self.comm.print_to_console.emit(f"<p style='color: #ff5555;'>Upload failed: {result}</p>")
+            log(f"Upload error: {result}", logging.WARNING)
+            playerror()
+
+class ChatClient(QMainWindow):
+    # the window: one asyncio loop thread, the worker pools, the HTTP client, the image cache and the message
+    # store, shared by a ServerTab per server. The first tab is the [server] from the config, the others are
+    # [tabs] servers
+    def __init__(self):
+        super().__init__()
+
+        self.loop = asyncio.new_event_loop()
+        self.shutdown_flag = False
+        image_config = CLI_CONFIG.get("images", {})
+        self.image_pool = ThreadPoolExecutor(max_workers=image_config.get("workers", 8), thread_name_prefix="image")
+        self.decode_pool = ThreadPoolExecutor(max_workers=image_config.get("decode_workers", os.cpu_count() or 2),
+                                              thread_name_prefix="decode")
+        self.spool_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")  # one worker keeps chunks in order
+        self.receive_pool = ThreadPoolExecutor(max_workers=CLI_CONFIG.get("receive", {}).get("workers", 2),
+                                               thread_name_prefix="receive")
+        http_config = CLI_CONFIG.get("http", {})
+        self.http = HttpClient(http_config.get("connections", 16), http_config.get("connections_per_host", 4),
+                               http_config.get("connect_timeout", 5), http_config.get("read_timeout", 15),
+                               http_config.get("max_image_mb", 20) * 1024 * 1024)
+        self.image_cache = ImageCache(os.path.join(CACHE_DIR, "images"),
+                                      image_config.get("cache_size_mb", 256) * 1024 * 1024,
+                                      image_config.get("cache_ttl_days", 7) * 86400)
+        self.message_store = MessageStore(HISTORY_DB)
+        self.spool_dir = tempfile.mkdtemp(prefix="gichat-scrollback-")  # per process: another instance has its own
+        self.tab_count = 0
+        self.first_paint = None
+
+        sound_config = CLI_CONFIG.get("sounds", {})
+        SOUND_CACHE.burst_window = sound_config.get("burst_window_ms", 250) / 1000
+        SOUND_CACHE.channels = sound_config.get("channels", 8)
+
+        self.init_ui()
+
+        self.register_gauges()
+        metrics_config = CLI_CONFIG.get("metrics", {})
+        if metrics_config.get("export_file"):
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(lambda: self.export_metrics(metrics_config["export_file"]))
+            self.metrics_timer.start(int(metrics_config.get("export_interval", 15) * 1000))
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self.save_image_index)
+        self.index_timer.start(int(image_config.get("index_save_interval", 30) * 1000))
+        QApplication.instance().aboutToQuit.connect(self.save_state)
+
+        threading.Thread(target=self.start_asyncio_loop, daemon=True).start()
+        self.open_tab(CLI_CONFIG["server"]["host"], CLI_CONFIG["server"]["port"], save=False)
+        for server in CLI_CONFIG.get("tabs", {}).get("servers", []):
+            try:
+                self.open_tab(*parse_server(server), save=False)
+            except ValueError:
+                log(f"Invalid server in [tabs]: {server}", logging.WARNING)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint is None:
+            self.first_paint = time.perf_counter() - STARTED
+            log(f"First paint after {self.first_paint * 1000:.0f}ms")
+            # sounds aren't needed before the connection is up, and loading pygame would only delay the paint
+            threading.Thread(target=SOUND_CACHE.preload, args=(CLI_CONFIG["client"]["soundpack"],), daemon=True).start()
+
+    def server_tabs(self):
+        return [self.tabs.widget(index) for index in range(self.tabs.count())]
+
+    def current_tab(self):
+        return self.tabs.currentWidget()
+
+    def open_tab(self, host, port, save=True):
+        address = f"{host}:{port}"
+        for index, tab in enumerate(self.server_tabs()):
+            if tab.address == address:
+                self.tabs.setCurrentIndex(index)
+                return tab
+        tab = ServerTab(self, host, port, self.tab_count)
+        self.tab_count += 1
+        index = self.tabs.addTab(tab, address)
+        self.tabs.setTabToolTip(index, address)
+        if index == 0:
+            self.tabs.tabBar().setTabButton(0, QTabBar.RightSide, None)  # the [server] tab stays
+        if save:
+            CLI_CONFIG.setdefault("tabs", {}).setdefault("servers", []).append(address)
+            save_config(CLI_CONFIG)
+            self.tabs.setCurrentIndex(index)
+        return tab
+
+    def close_tab(self, index):
+        if index == 0:
+            return
+        tab = self.tabs.widget(index)
+        self.tabs.removeTab(index)
+        tab.shutdown()
+        servers = CLI_CONFIG.get("tabs", {}).get("servers", [])
+        if tab.address in servers:
+            servers.remove(tab.address)
+            save_config(CLI_CONFIG)
+        tab.deleteLater()
+
+    def tab_changed(self, index):
+        current = self.tabs.widget(index)
+        for tab in self.server_tabs():
+            if tab is not current:
+                tab.set_active(False)
+        if current is not None:
+            self.tabs.tabBar().setTabTextColor(index, QColor())  # back to the palette's text color
+            current.set_active(True)
+
+    def name_tab(self, tab, name):
+        index = self.tabs.indexOf(tab)
+        if index >= 0:
+            self.tabs.setTabText(index, name)
+
+    def mark_unread(self, tab):
+        if not tab.unread:
+            tab.unread = True
+            self.tabs.tabBar().setTabTextColor(self.tabs.indexOf(tab), QColor("#ffcc00"))
+
+    def show_new_tab_dialog(self):
+        text, ok = QInputDialog.getText(self, "New tab", "Server (host:port):")
+        if ok and text.strip():
+            try:
+                host, port = parse_server(text)
+            except ValueError:
+                QMessageBox.critical(self, "Error", f"Invalid server address: {text}")
+                return
+            self.open_tab(host, port)
+
+    def show_search_window(self, query):
+        if query:
+            self.search_window = SearchWindow(self, query)
+            self.search_window.show()
+
+    def show_config_window(self):
+        self.conf_window = ConfigWindow(self)
+        self.conf_window.show()
+
+    def show_debug_window(self):
+        self.debug_window = DebugWindow(self)
+        self.debug_window.show()
+
+    def register_gauges(self):
+        # read on the GUI thread by the Debug window and the export timer; per-tab numbers are summed
+        total = lambda read: lambda: sum(read(tab) for tab in self.server_tabs())
+        METRICS.gauge("tabs", self.tabs.count)
+        METRICS.gauge("connections", total(lambda tab: tab.core.is_connected()))
+        METRICS.gauge("console_queue", total(lambda tab: len(tab.console_queue) + len(tab.held_console or ())))
+        METRICS.gauge("outbox", total(lambda tab: len(tab.core.outbox)))
+        METRICS.gauge("receive_queue", total(lambda tab: tab.core.frames.qsize() if tab.core.frames else 0))
+        METRICS.gauge("store_queue", self.message_store.queue.qsize)
+        METRICS.gauge("image_queue", self.image_pool._work_queue.qsize)
+        METRICS.gauge("decode_queue", self.decode_pool._work_queue.qsize)
+        METRICS.gauge("image_slots", total(lambda tab: len(tab.image_slots)))
+        METRICS.gauge("image_loads", total(lambda tab: len(tab.image_loading)))
+        METRICS.gauge("decoded_image_bytes", total(lambda tab: sum(tab.image_bytes.values())))
+        METRICS.gauge("document_blocks", total(lambda tab: tab.console.document().blockCount()))
+        METRICS.gauge("document_characters", total(lambda tab: tab.console.document().characterCount()))
+        METRICS.gauge("document_images", total(lambda tab: len(tab.image_refs)))
+        METRICS.gauge("scrollback_chunks", total(lambda tab: len(tab.scrollback)))
+
+    def save_image_index(self):
+        # on the image pool, so neither this thread nor the loop waits on the disk
+        future = self.image_pool.submit(self.image_cache.save)
+        future.add_done_callback(lambda future: future.exception() and log(f"Could not save the image index: {future.exception()}",
+                                                                            logging.WARNING))
+
+    def save_state(self):
+        # closing the window ends the session as well as Options > Exit does
+        self.image_cache.save()
+        self.message_store.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def export_metrics(self, path):
+        try:
+            METRICS.export(path)
+        except OSError as e:
+            log(f"Could not export metrics to {path}: {e}", logging.WARNING)
+
+    def init_ui(self):
+        self.setWindowTitle(f"GIchat Client {CLI_VERSION}")
+        self.setStyleSheet("background-color: #000000; color: white")
+        self.setGeometry(100, 100, 900, 500)
+        self.setWindowIcon(QIcon("assets/images/GIchat_Icon.ico"))
+
+        self.tabs = QTabWidget(self)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setDocumentMode(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.tab_changed)
+        self.setCentralWidget(self.tabs)
 
         # Menu bar
         menubar = QMenuBar(self)
@@ -405,245 +1789,54 @@ class ChatClient(QMainWindow):
         bugreport_action.triggered.connect(lambda: webbrowser.open("https://github.com/HazmatPants/GIchat-client-2.0/issues/new"))
         
         options_menu.addAction(bugreport_action)
+
+        new_tab_action = QAction("New tab", self)
+        new_tab_action.setShortcut("Ctrl+T")
+        new_tab_action.triggered.connect(self.show_new_tab_dialog)
+        options_menu.addAction(new_tab_action)
         
         conf_action = QAction("Settings", self)
-        conf_action.triggered.connect(self.comm.show_conf.emit)
+        conf_action.triggered.connect(self.show_config_window)
         
         options_menu.addAction(conf_action)
 
+        debug_action = QAction("Debug", self)
+        debug_action.triggered.connect(self.show_debug_window)
+        options_menu.addAction(debug_action)
+
         exit_action = QAction("Exit", self)
-        exit_action.triggered.connect(lambda: asyncio.run_coroutine_threadsafe(self.client_exit(), self.loop))
+        exit_action.triggered.connect(lambda: asyncio.run_coroutine_threadsafe(
+            self.client_exit([tab.core for tab in self.server_tabs()]), self.loop))
         options_menu.addAction(exit_action)
 
         self.setMenuBar(menubar)
 
-    def print_to_console(self, text, image=None):
-        cursor = self.console.textCursor()
-        cursor.movePosition(QTextCursor.End)
-        self.console.setTextCursor(cursor)
-
-        if image and isinstance(image, QPixmap):
-            image_id = str(uuid.uuid4())  # unique ID per image
-            self.console.insertPlainText("\n")
-            self.console.document().addResource(
-                QTextDocument.ImageResource,
-                QUrl(image_id),
-                image
-            )
-            cursor.insertImage(image_id)
-            self.console.insertPlainText("\n")
-        elif isinstance(image, str):
-            self.console.insertHtml(f'<img src="{image}" width="200">')
-
-        if text:
-            self.console.insertHtml(text + "<br>")
-
-        self.console.moveCursor(QTextCursor.End)
-
-    
-    def clear_console(self):
-        self.comm.clear_console.emit()
-    
-    async def retrieve_messages(self):
-        data = {
-            "username": username,
-            "message": "RAW:MSGDB",
-            "event": "request",
-            "type": "msg"
-        }
-        await self.websocket.send(json.dumps(data))
-        log("Requesting message DB from server...")
-
-        messages = await self.websocket.recv()
-        messages = json.loads(messages)
-        log(f"Retrieved {len(messages)} messages from server")
-
-        self.comm.load_messages.emit(messages)
-
-    def ping_server(self):
-        responsetime = ping(host)
-        if responsetime:
-            QMessageBox.information(self, "Ping Successful",
-                                    f"Response Time: {round(responsetime * 1000, 2)}ms")
-        else:
-            QMessageBox.critical(self, "Ping Failed", "Host unreachable")
-
     def start_asyncio_loop(self):
+        # every tab's core runs here; ServerTab schedules its own start
         asyncio.set_event_loop(self.loop)
-        try:
-            self.loop.run_until_complete(self.connect())
-        except ConnectionRefusedError:
-            QMessageBox.critical(self, "Connection Error", "Connection Refused")
         while not self.shutdown_flag:
             self.loop.run_forever()
 
-    async def connect(self):
-        uri = f"ws://{host}:{port}"
-        try:
-            self.websocket = await websockets.connect(uri)
-            await self.websocket.send(username)
-            server_info = await self.websocket.recv()
-            server_info = json.loads(server_info)
-            playeventsound("connect")
-            data = {
-                "username": username,
-                "message": "RAW:USERLIST",
-                "event": "request",
-                "type": "msg"
-            }
-            await self.websocket.send(json.dumps(data))
-            log(f"Requesting user list from server...")
-            online_users = await self.websocket.recv()
-            online_users = json.loads(online_users)
-            log(f"Retrieved user list")
-            await self.retrieve_messages()
-            self.comm.print_to_console.emit(f"Connected to &quot;{server_info['name']}&quot; ({uri})", None)
-            if type(online_users) == list:
-                users = ", ".join(online_users)
-                self.comm.print_to_console.emit("Online Users: " + users + "<br>", None)
-            self.server_status_label.setText(f"Connected to \"{server_info['name']}\" ({uri})")
-            self.server_status_dot.setStyleSheet("background-color: #00ff00; border-radius: 5px;")
-            await self.receive_messages()
-        except Exception as e:
-            self.comm.print_to_console.emit(f"<p style='color: #ff5555;'> Connection failed: {e}</p>", None)
-            traceback.print_exc()
-            playerror()
-
-    async def disconnect(self, reason: str):
-        if self.websocket:
-            try:
-                await self.websocket.close(reason="Client Disconnect")
-            except Exception as e:
-                log(f"WebSocket close error: {e}")
-            self.websocket = None
-            if reason == "client":
-                playeventsound("disconnect")
-            elif reason == "kick":
-                playeventsound("kicked")
-            self.comm.print_to_console.emit("Disconnected.", None)
-            self.server_status_label.setText("Offline")
-            self.server_status_dot.setStyleSheet("background-color: red; border-radius: 5px;")
-
-    async def reconnect(self):
-        self.comm.print_to_console.emit("Reconnecting...", None)
-        await self.disconnect(reason="reconnect")
-        await self.connect()
-
-    async def client_exit(self):
+    async def client_exit(self, cores):
         self.shutdown_flag = True
-        await self.disconnect(reason="client")
+        await asyncio.gather(*(core.close() for core in cores))
+        await self.http.close()
+        log(f"HTTP stats: {self.http.stats}")
+        self.save_state()
+        log(f"Markdown render stats: {markdown_stats()}")
         log("Client exited")
+        if LOG_LISTENER:
+            LOG_LISTENER.stop()  # os._exit skips atexit handlers
         self.close()
         os._exit(0)
 
-    def send_message(self):
-        msg = self.message_input.toPlainText().strip()
-        if msg:
-            self.message_input.clear()
-            asyncio.run_coroutine_threadsafe(self._send_message(msg), self.loop)
-
-    async def _send_message(self, msg):
-        data = {
-            "type": "msg",
-            "username": username,
-            "message": msg,
-            "event": "send_message",
-            "admin_key": CLI_CONFIG["client"].get("admin_key", " ")
-        }
-
-        if self.websocket and self.websocket.open:
-            await self.websocket.send(json.dumps(data))
-            playeventsound("send_message")
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            if msg.startswith("[Image] http"):
-                url = msg.split(" ", 1)[1]
-                self.comm.print_to_console.emit(f"[{timestamp}] &lt;{username}&gt; sent an image: {url}", None)
-                try:
-                    response = requests.get(url)
-                    response.raise_for_status()
-                    image_data = response.content
-                    pixmap = QPixmap()
-                    pixmap.loadFromData(image_data)
-                    pixmap = pixmap.scaledToWidth(300, Qt.SmoothTransformation)
-                    self.comm.print_to_console.emit("", pixmap)
-                except Exception as e:
-                    self.comm.print_to_console.emit("Failed to load image.", None)
-                    log(f"Image load error (sender): {e}")
-            else:
-                self.comm.print_to_console.emit(f"[{timestamp}] &lt;{username}&gt;", None)
-                msg_html = markdown_to_html(msg)
-                self.comm.print_to_console.emit(msg_html, None)
-
-    def send_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select a file", "", "Image files (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff *.xpm *.ico)")
-        if file_path:
-            files = {'file': open(file_path, 'rb')}
-            response = requests.post(f"http://{host}:8000/upload", files=files)
-            if response.ok:
-                filename = response.json()['filename']
-                msg = f"[Image] http://{host}:8000/uploads/{filename}"
-                asyncio.run_coroutine_threadsafe(self._send_message(msg), self.loop)
-
-    async def receive_messages(self):
-        try:
-            async for message in self.websocket:
-                try:
-                    data = json.loads(message)
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    if data["event"] == "srv_message":
-                        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        self.comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt;", None)
-                        self.comm.print_to_console.emit(data['message'] + "<br>", None)
-                        if "join" in data['message']:
-                            playeventsound("user_join")
-                        elif "left" in data['message']:
-                            playeventsound("user_leave")
-                        elif "have been kicked" in data['message']:
-                            await self.disconnect("kick")
-                    elif data["event"] == "srv_command":
-                        if data['message'] == "CLEAR_MESSAGE_DB":
-                            self.comm.clear_console.emit()
-                            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            self.comm.print_to_console.emit(f"[{timestamp}] &lt;server&gt;", None)
-                            self.comm.print_to_console.emit("Message DB was cleared.", None)
-                    else:
-                        if data["type"] == "msg" and not data["event"] == "request":
-                            message = data['message']
-                            if message.startswith("[Image] http"):
-                                url = message.split(" ", 1)[1]
-                                try:
-                                    image_data = requests.get(url).content
-                                    pixmap = QPixmap()
-                                    pixmap.loadFromData(image_data)
-                                    pixmap = pixmap.scaledToWidth(300, Qt.SmoothTransformation)
-                                    self.comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt; sent an image: {url}", pixmap)
-                                except Exception as e:
-                                    self.comm.print_to_console.emit("Failed to load image.", None)
-                                    log(f"Image load error: {e}")
-                            elif message.startswith("[File] http"):
-                                url = message.split(" ", 1)[1]
-                                self.comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt; sent an file: {url}")
-                            else:
-                                msg_html = markdown_to_html(data['message'])
-                                self.comm.print_to_console.emit(f"[{timestamp}] &lt;{data['username']}&gt;", None)
-                                self.comm.print_to_console.emit(msg_html, None)
-                            
-                        playeventsound("rcv_message")
-                except json.JSONDecodeError:
-                    self.comm.print_to_console.emit("Received invalid JSON", None)
-                except Exception as e:
-                    log(f"Error occurred when receiving a message: {e}")
-        except websockets.exceptions.ConnectionClosed:
-            self.comm.print_to_console.emit("Connection closed.", None)
-
 
 if __name__ == '__main__':
+    LOG_LISTENER = setup_logging()
     app = QApplication(sys.argv)
     try:
         CLI_CONFIG = load_config()
-        username = CLI_CONFIG["client"]["username"]
-        host = CLI_CONFIG["server"]["host"]
-        port = CLI_CONFIG["server"]["port"]
+        set_log_level(CLI_CONFIG["client"].get("log_level", "INFO"))
     except Exception as e:
         QMessageBox.critical(None, "Config Error", str(e))
         sys.exit(1)
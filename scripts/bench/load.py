@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from clientCore import ChatCore, default_config
+
+# Runs N simulated clients in one process against a server (by default a freshly spawned stand-in, see
+# server.py). Each client is a real ChatCore, so the numbers cover connect(), retrieve_messages(),
+# receive_messages() and the outbox exactly as the GUI and CLI use them.
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def percentiles(samples, points=(50, 90, 95, 99)):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {f"p{point}": ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] * 1000 for point in points}
+    result["max"] = ordered[-1] * 1000
+    return result
+
+
+class Stats:
+    def __init__(self):
+        self.connect_times = []
+        self.connect_failures = 0
+        self.latencies = []
+        self.sent = 0
+        self.received = 0
+
+
+class BenchClient(ChatCore):
+    def __init__(self, config, stats, executor):
+        super().__init__(config, executor=executor)
+        self.stats = stats
+        self.started = None
+        self.connected = asyncio.Event()
+
+    def on_connected(self, server_info, online_users):
+        self.stats.connect_times.append(time.perf_counter() - self.started)
+        self.connected.set()
+
+    def on_connect_failed(self, error):
+        self.stats.connect_failures += 1
+
+    def on_message(self, data, timestamp, prepared=None):
+        # bench messages carry their send time; every client lives in this process, so the clocks agree
+        if data["type"] == "msg" and data["event"] == "send_message" and data["message"].startswith("bench "):
+            self.stats.latencies.append(time.perf_counter() - float(data["message"].split()[2]))
+            self.stats.received += 1
+
+    def on_send_status(self, entry, state):
+        if state == "sent":
+            self.stats.sent += 1
+
+
+def client_config(args, index):
+    config = default_config()
+    config["client"]["username"] = f"bench_{index}"
+    config["server"]["host"] = args.host
+    config["server"]["port"] = args.port
+    config["reconnect"]["base_delay"] = 0.1
+    config["reconnect"]["connect_timeout"] = args.timeout
+    if args.no_compression:
+        config["protocol"]["compression"] = ""
+    return config
+
+
+async def sender(client, rate, duration):
+    seq = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        client.queue_message(f"bench {seq} {time.perf_counter()!r}")
+        seq += 1
+        await asyncio.sleep(1 / rate)
+
+
+async def run(args):
+    stats = Stats()
+    executor = ThreadPoolExecutor(4, thread_name_prefix="receive")  # shared, like one process serving many bots
+    clients = [BenchClient(client_config(args, index), stats, executor) for index in range(args.clients)]
+
+    # connect storm: everyone at once, the way a room comes back after a server restart
+    storm_start = time.perf_counter()
+    for client in clients:
+        client.started = time.perf_counter()
+        client.start()
+    try:
+        await asyncio.wait_for(asyncio.gather(*(client.connected.wait() for client in clients)), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    storm_time = time.perf_counter() - storm_start
+    connected = sum(client.connected.is_set() for client in clients)
+
+    senders = [client for client in clients if client.connected.is_set()][:args.senders]
+    run_start = time.perf_counter()
+    await asyncio.gather(*(sender(client, args.rate, args.duration) for client in senders))
+    await asyncio.sleep(args.drain)  # let the last fan-out arrive
+    elapsed = time.perf_counter() - run_start
+
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+    expected = stats.sent * (connected - 1)
+    return {
+        "clients": args.clients,
+        "senders": len(senders),
+        "history": args.history if args.spawned else None,
+        "connect": {
+            "connected": connected,
+            "failures": stats.connect_failures,
+            "storm_ms": storm_time * 1000,
+            **percentiles(stats.connect_times)
+        },
+        "messages": {
+            "sent": stats.sent,
+            "received": stats.received,
+            "expected": expected,
+            "delivered_ratio": stats.received / expected if expected else None,
+            "sent_per_sec": stats.sent / elapsed,
+            "received_per_sec": stats.received / elapsed
+        },
+        "fanout_latency_ms": percentiles(stats.latencies)
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(args):
+    args.host = "127.0.0.1"
+    args.port = free_port()
+    command = [sys.executable, SERVER, "--port", str(args.port), "--history", str(args.history)]
+    if args.no_compression:
+        command.append("--no-compression")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()  # printed once the server is listening
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connect storm, throughput and fan-out latency with N simulated clients")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--senders", type=int, default=10, help="how many of the clients send messages")
+    parser.add_argument("--rate", type=float, default=2, help="messages per second per sender")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=2, help="seconds to wait for deliveries after sending stops")
+    parser.add_argument("--history", type=int, default=1000, help="message DB size of the spawned stand-in server")
+    parser.add_argument("--timeout", type=float, default=30, help="connect storm timeout in seconds")
+    parser.add_argument("--host", help="use a running server instead of spawning the stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-compression", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    args.spawned = not args.host
+    server = spawn_server(args) if args.spawned else None
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    connect, messages, latency = result["connect"], result["messages"], result["fanout_latency_ms"]
+    print(f"{result['clients']} clients, {result['senders']} senders at {args.rate}/s for {args.duration}s"
+          + (f", {result['history']} history messages" if args.spawned else f" against ws://{args.host}:{args.port}"))
+    print(f"connect storm: {connect['connected']}/{result['clients']} in {connect['storm_ms']:.0f}ms, "
+          f"{connect['failures']} failed attempts")
+    if connect["connected"]:
+        print("  per client ms: " + " ".join(f"{key} {connect[key]:.1f}" for key in ("p50", "p90", "p95", "p99", "max")))
+    print(f"messages: {messages['sent']} sent ({messages['sent_per_sec']:.1f}/s), "
+          f"{messages['received']}/{messages['expected']} delivered ({messages['received_per_sec']:.1f}/s)")
+    if latency:
+        print("fan-out latency ms: " + " ".join(f"{key} {value:.1f}" for key, value in latency.items()))
+
+
+if __name__ == "__main__":
+    main()
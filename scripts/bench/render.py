@@ -0,0 +1,260 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..", "..")
+sys.path.insert(0, ROOT)
+from clientCore import CLI_VERSION, default_config
+from wire_format import make_history
+from load import free_port, SERVER
+
+# Replays a synthetic history through the GUI's render path on an offscreen display. Every history size
+# runs in its own worker process so peak memory isn't carried over from the previous one.
+
+STAGES = ("markdown_cold", "markdown_warm", "console", "loading", "images", "decode_jpeg", "decode_png", "decode_cached")
+
+
+def reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(results, name, count, fn):
+    reset_peak_rss()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    results[name] = {"count": count, "seconds": seconds, "per_sec": count / seconds if seconds else None,
+                     "peak_rss_mb": peak_rss_mb()}
+
+
+def make_images(count, size):
+    from PIL import Image
+    images = []
+    for i in range(count):
+        image = Image.effect_mandelbrot(size, (-2 + i * 0.01, -1.2, 0.8, 1.2), 64).convert("RGB")
+        out = io.BytesIO()
+        image.save(out, format="JPEG" if i % 2 == 0 else "PNG")
+        images.append(out.getvalue())
+    return images
+
+
+def serve_images(images):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like a real image host
+
+        def do_GET(self):
+            data = images[int(self.path.rsplit("/", 1)[1])]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_for(app, condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return condition()
+
+
+def run_worker(args):
+    from PyQt5.QtWidgets import QApplication
+    import clientGUI
+    app = QApplication(sys.argv[:1])
+    clientGUI.set_log_level("WARNING")
+
+    scratch = tempfile.mkdtemp(prefix="gichat-bench-")
+    clientGUI.CACHE_DIR = scratch
+    clientGUI.HISTORY_DB = os.path.join(scratch, "history.db")
+
+    # an empty stand-in server, so the window has something to connect to
+    port = free_port()
+    server = subprocess.Popen([sys.executable, SERVER, "--port", str(port), "--history", "0"], stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()
+    config = default_config()
+    config["client"]["username"] = "bench"
+    config["server"] = {"host": "127.0.0.1", "port": port}
+    clientGUI.CLI_CONFIG = config
+
+    images = make_images(args.images, tuple(int(side) for side in args.image_size.split("x")))
+    image_server = serve_images(images)
+    history = make_history(args.size, args.users, args.image_ratio, markdown_ratio=args.markdown_ratio,
+                           image_url=f"http://127.0.0.1:{image_server.server_port}/img/{{}}", images=len(images))
+    texts = [content.strip() for _, content, _ in history if not content.startswith("[Image] http")]
+    results = {}
+
+    try:
+        clientGUI._render_markdown.cache_clear()
+        measure(results, "markdown_cold", len(texts), lambda: [clientGUI.markdown_to_html(text) for text in texts])
+        measure(results, "markdown_warm", len(texts), lambda: [clientGUI.markdown_to_html(text) for text in texts])
+
+        window = clientGUI.ChatClient()
+        window.show()
+        tab = window.current_tab()
+        wait_for(app, tab.core.is_connected, 10)
+        wait_for(app, lambda: False, 0.2)  # let the connect lines render
+
+        def console():
+            for message_username, content, timestamp in history:
+                tab.print_to_console(f"[{timestamp}] &lt;{message_username}&gt;")
+                tab.print_to_console(clientGUI.markdown_to_html(content.strip()))
+            tab.flush_console()
+        measure(results, "console", len(history), console)
+        results["console"]["blocks"] = tab.console.document().blockCount()
+        results["console"]["characters"] = tab.console.document().characterCount()
+        tab.reset_console()
+
+        loaded = []
+        tab.comm.image_loaded.connect(lambda slot_id, result: loaded.append(slot_id))
+
+        def loading():
+            tab.show_loading_window(history, True)
+            wait_for(app, lambda: tab.loading_window.isHidden(), 3600)
+            tab.flush_console()
+        measure(results, "loading", len(history), loading)
+
+        # counted from the end of the text pass: the viewport walks up the console in fixed steps, and each stop
+        # waits for the images around it to be fetched, decoded and shown. Stops short of the top, where paging
+        # in the scrollback would change the document under the walk
+        scrollbar = tab.console.verticalScrollBar()
+        settled = lambda: not tab.console_queue and not tab.image_timer.isActive() and not tab.image_loading
+
+        def walk():
+            wait_for(app, settled, 600)
+            for stop in range(args.scroll_stops, 0, -1):
+                scrollbar.setValue(scrollbar.maximum() * stop // args.scroll_stops)
+                wait_for(app, settled, 600)
+        measure(results, "images", 0, walk)
+        results["images"].update(count=len(loaded), slots=len(tab.image_slots), stops=args.scroll_stops,
+                                 placeholders=sum(slot["digest"] is None for slot in tab.image_slots.values()))
+        results["images"]["per_sec"] = len(loaded) / results["images"]["seconds"]
+
+        cache = clientGUI.ImageCache(os.path.join(scratch, "decode"), 1 << 40, 86400)
+        for name, offset in (("decode_jpeg", 0), ("decode_png", 1)):
+            picks = [images[(offset + 2 * i) % len(images)] for i in range(args.decode)]
+            measure(results, name, len(picks), lambda: [clientGUI.decode_image(cache, f"bench://{name}/{i}", None, data)
+                                                        for i, data in enumerate(picks)])
+        thumbs = [cache.thumb(cache.get(f"bench://decode_jpeg/{i}")[0]) for i in range(args.decode)]
+        measure(results, "decode_cached", len(thumbs), lambda: [clientGUI.decode_image(cache, None, "x", thumb) for thumb in thumbs])
+    finally:
+        server.terminate()
+        image_server.shutdown()
+    print(json.dumps(results))
+    os._exit(0)  # skip the GUI's threads and atexit handlers
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(report, baseline=None):
+    print(f"GIchat {report['version']} ({report['commit']}), {report['params']['image_ratio']:.0%} images, "
+          f"{report['params']['markdown_ratio']:.0%} markdown")
+    print(f"{'messages':>9} {'stage':<14} {'count':>8} {'seconds':>9} {'per sec':>11} {'peak MB':>8}" + ("  vs baseline" if baseline else ""))
+    for size, stages in report["results"].items():
+        for name in STAGES:
+            stage = stages.get(name)
+            if not stage:
+                continue
+            line = (f"{size:>9} {name:<14} {stage['count']:>8} {stage['seconds']:>9.3f} "
+                    f"{stage['per_sec'] or 0:>11,.0f} {stage['peak_rss_mb']:>8.0f}")
+            old = (baseline or {}).get("results", {}).get(size, {}).get(name)
+            if old and old.get("per_sec") and stage["per_sec"]:
+                line += f"  {stage['per_sec'] / old['per_sec']:.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offscreen benchmarks for markdown, console, history loading and image decode")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated history sizes")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--image-ratio", type=float, default=0.05)
+    parser.add_argument("--markdown-ratio", type=float, default=0.2)
+    parser.add_argument("--images", type=int, default=20, help="distinct images in the history")
+    parser.add_argument("--image-size", default="1280x720")
+    parser.add_argument("--decode", type=int, default=20, help="images per decode stage")
+    parser.add_argument("--scroll-stops", type=int, default=10, help="viewport positions the images stage walks through")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous --output file to compare throughput against")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    report = {
+        "version": CLI_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: getattr(args, key) for key in ("users", "image_ratio", "markdown_ratio", "images", "image_size", "decode",
+                                                        "scroll_stops")},
+        "results": {}
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size)]
+        for key, value in report["params"].items():
+            command += [f"--{key.replace('_', '-')}", str(value)]
+        worker = subprocess.run(command, capture_output=True, text=True)
+        if worker.returncode != 0:
+            sys.exit(f"worker for {size} messages failed:\n{worker.stderr}")
+        report["results"][str(size)] = json.loads(worker.stdout.strip().splitlines()[-1])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from clientCore import WIRE_FORMATS, WIRE_JSON, encode_frame, decode_frame
+from wire_format import make_history, compact
+
+# Stand-in for a GIchat server: just enough of the protocol for the client and the load generator.
+# Handshake is username -> server info, then RAW:USERLIST and RAW:MSGDB requests; send_message is
+# fanned out to everyone else, joins and leaves are announced as srv_message. A MSGDB request with
+# "chunk" gets the history as {"history": {"start", "total", "messages"}} frames, newest first.
+
+
+class StandInServer:
+    def __init__(self, name, history, capabilities):
+        self.name = name
+        self.history = history
+        self.capabilities = capabilities
+        self.clients = {}
+
+    async def send(self, websocket, data):
+        await websocket.send(encode_frame(data, websocket.subprotocol or WIRE_JSON))
+
+    def broadcast(self, data, exclude=None):
+        # one encode per wire format, however many clients are listening
+        groups = {}
+        for websocket in self.clients:
+            if websocket is not exclude:
+                groups.setdefault(websocket.subprotocol or WIRE_JSON, []).append(websocket)
+        for wire_format, websockets_ in groups.items():
+            websockets.broadcast(websockets_, encode_frame(data, wire_format))
+
+    def announce(self, message, exclude=None):
+        self.broadcast({"type": "msg", "event": "srv_message", "username": "server", "message": message}, exclude)
+
+    async def handle_request(self, websocket, data):
+        if data["message"] == "RAW:USERLIST":
+            await self.send(websocket, sorted(self.clients.values()))
+        elif data["message"] == "RAW:MSGDB":
+            since = data.get("since", 0) if "msgdb_since" in self.capabilities else 0
+            pack = compact if data.get("compact") and "compact_history" in self.capabilities else list
+            if data.get("chunk") and "chunked_history" in self.capabilities:
+                # the history only grows, so everything below total stays put while we stream it
+                total = len(self.history)
+                end = total
+                while True:
+                    start = max(since, end - data["chunk"])
+                    await self.send(websocket, {"history": {"start": start, "total": total,
+                                                            "messages": pack(self.history[start:end])}})
+                    if start == since:
+                        break
+                    end = start
+            else:
+                await self.send(websocket, pack(self.history[since:]))
+
+    async def handler(self, websocket):
+        username = await websocket.recv()
+        await self.send(websocket, {"name": self.name, "capabilities": self.capabilities})
+        self.announce(f"{username} has joined the chat", websocket)
+        self.clients[websocket] = username
+        try:
+            async for message in websocket:
+                data = decode_frame(message)
+                if data.get("event") == "request":
+                    await self.handle_request(websocket, data)
+                elif data.get("event") == "send_message":
+                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    self.history.append([data["username"], data["message"], timestamp])
+                    self.broadcast({"type": "msg", "event": "send_message", "username": data["username"],
+                                    "message": data["message"], "timestamp": timestamp}, websocket)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            del self.clients[websocket]
+            self.announce(f"{username} has left the chat")
+
+
+async def serve(args):
+    capabilities = [] if args.no_capabilities else ["msgdb_since", "compact_history", "chunked_history"]
+    if args.no_chunks and capabilities:
+        capabilities.remove("chunked_history")
+    server = StandInServer(args.name, make_history(args.history, args.users, args.image_ratio), capabilities)
+    formats = [WIRE_JSON] if args.json_only else WIRE_FORMATS
+    async with websockets.serve(server.handler, args.host, args.port, subprotocols=formats, max_size=None,
+                                compression=None if args.no_compression else "deflate"):
+        print(f"Stand-in server on ws://{args.host}:{args.port} ({args.history} messages, {', '.join(formats)})", flush=True)
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in GIchat server for benchmarks and offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--name", default="bench")
+    parser.add_argument("--history", type=int, default=1000, help="synthetic messages in the message DB")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--image-ratio", type=float, default=0.0)
+    parser.add_argument("--no-capabilities", action="store_true", help="behave like an old server: no delta or compact history")
+    parser.add_argument("--no-chunks", action="store_true", help="send the history as one frame even when asked for chunks")
+    parser.add_argument("--json-only", action="store_true", help="don't offer the msgpack wire format")
+    parser.add_argument("--no-compression", action="store_true")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+WORDS = ("hello there anyone on tonight lol yeah the server was down again brb gonna grab food "
+         "did you see that new update it broke my sounds again works fine for me which pack "
+         "teamspeak obviously gg nice one").split()
+
+
+MARKDOWN = (
+    "**{}**",
+    "*{}*",
+    "`{}`",
+    "> {}",
+    "- {}\n- {}",
+    "1. {}\n2. {}",
+    "[{}](http://example.com/)",
+    "# {}",
+    "```\n{}\n```",
+)
+
+
+def make_history(count, users, image_ratio, seed=1, markdown_ratio=0.1,
+                 image_url="http://grigga-industries.ydns.eu:8000/uploads/{:016x}.png", images=None):
+    # images limits how many distinct image URLs appear, like a room reposting the same memes
+    rng = random.Random(seed)
+    names = [f"{rng.choice(['Grigga', 'Hazmat', 'NewUser', 'pants', 'xX_', 'Lurker'])}_{rng.randint(1, 99999)}" for _ in range(users)]
+    start = datetime(2025, 1, 1)
+    history = []
+    for i in range(count):
+        if rng.random() < image_ratio:
+            content = "[Image] " + image_url.format(rng.randrange(images) if images else rng.getrandbits(64))
+        else:
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 25)))
+            if rng.random() < markdown_ratio:
+                template = rng.choice(MARKDOWN)
+                words = content.split()
+                content = template.format(*(" ".join(words[j::2]) or "x" for j in range(template.count("{}"))))
+        timestamp = (start + timedelta(seconds=i * 37)).strftime("%Y-%m-%d %H:%M:%S")
+        history.append([rng.choice(names), content, timestamp])
+    return history
+
+
+def compact(history):
+    users = {}
+    rows = [[users.setdefault(username, len(users)), content, timestamp] for username, content, timestamp in history]
+    return {"users": list(users), "rows": rows}
+
+
+def deflated_size(payload):
+    # permessage-deflate compresses each frame as a raw deflate stream
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    compressor = zlib.compressobj(wbits=-15)
+    return len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def codecs():
+    yield "json", json.dumps, json.loads
+    if orjson:
+        yield "orjson", lambda data: orjson.dumps(data).decode("utf-8"), orjson.loads
+    if msgpack:
+        yield "msgpack", msgpack.packb, msgpack.unpackb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes on the wire and codec time for a RAW:MSGDB history dump")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--image-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    history = make_history(args.messages, args.users, args.image_ratio)
+    shapes = {"list": history, "compact": compact(history)}
+    results = []
+    for name, encode, decode in codecs():
+        for shape, data in shapes.items():
+            payload = encode(data)
+            results.append({
+                "codec": name,
+                "shape": shape,
+                "bytes": len(payload),
+                "deflate_bytes": deflated_size(payload),
+                "encode_ms": round(best_of(lambda: encode(data), args.repeat), 2),
+                "decode_ms": round(best_of(lambda: decode(payload), args.repeat), 2)
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.messages} messages, {args.users} users, {args.image_ratio:.0%} images")
+    print(f"{'codec':<8} {'shape':<8} {'bytes':>11} {'deflated':>11} {'encode ms':>10} {'decode ms':>10}")
+    for result in results:
+        print(f"{result['codec']:<8} {result['shape']:<8} {result['bytes']:>11,} {result['deflate_bytes']:>11,} "
+              f"{result['encode_ms']:>10} {result['decode_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()